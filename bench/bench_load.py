@@ -0,0 +1,357 @@
+# bench/bench_load.py
+"""
+Нагрузочный прогон бота без gelbooru.com и Telegram: поднимает подставные серверы из
+bench/fakes.py и гоняет через них настоящий код бота на синтетических пользователях.
+
+Сценарии:
+    cache      — Cache.get_post с разными наборами фильтров и периодами;
+    buttons    — смесь нажатий кнопок апдейтами через Dispatcher с роутерами бота
+                 (вместе с middleware защиты от частых нажатий);
+    broadcast  — send_image_toeveryone по всем подписчикам.
+
+Фоновые службы (профили, «уже видел», координация, предзагрузка, пережатие фото)
+запускаются и останавливаются так же, как в bot.py; планировщик и /metrics — нет.
+
+Для каждого печатается пропускная способность, p50/p99/max задержки, ошибки, пиковый RSS
+и сколько запросов дошло до «Gelbooru» и «Telegram».
+
+Нужен локальный Postgres (DATABASE_URL или --database-url): всё пишется в отдельную схему
+bench_load, которая пересоздаётся при каждом запуске; боевые таблицы не трогаются.
+
+Запуск из корня репозитория:
+    python -m bench.bench_load                                   # все сценарии
+    python -m bench.bench_load cache buttons --users 5000 --concurrency 200
+    python -m bench.bench_load broadcast --tg-latency 30 --tg-429 0.01 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+from bench.fakes import FakeBotApi, FakeGelbooru
+
+BENCH_SCHEMA = "bench_load"
+SCENARIOS = ("cache", "buttons", "broadcast")
+
+# без .env бот не импортируется; load_dotenv не перетирает уже заданные переменные
+ENV_DEFAULTS = {
+    "TOKEN": "123456:BENCH",
+    "CACHE_REFILL_SIZE": "60",
+    "CACHE_TTL": "900",
+    "CACHE_MAX_KEYS": "100",
+    "CACHE_MAX_PAGES": "3",
+    "METRICS_PORT": "0",
+}
+
+FILTER_MIX = [[], [], ["nsfw"], ["sfw"], ["gay"], ["sfw", "gay"], ["yaoi"], ["nsfw", "male"], ["lowres", "trap"]]
+BUTTON_MIX = [
+    ("🎲 Случайная картинка", 6),
+    ("🥈 За неделю", 2),
+    ("🥉 За день", 1),
+    ("🥇 За месяц", 1),
+    ("🔞 Получить картинку", 1),
+]
+USERS_TABLE = f"""
+    CREATE TABLE {BENCH_SCHEMA}.users (
+        telegram_id BIGINT PRIMARY KEY,
+        username    TEXT,
+        subscribed  BOOLEAN NOT NULL DEFAULT TRUE,
+        filters     TEXT[] NOT NULL DEFAULT '{{}}'
+    )
+"""
+
+
+class Recorder:
+    """Задержки отдельных операций одного сценария."""
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    async def timed(self, coro: Awaitable[Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors += 1
+            logging.debug("bench op failed: %r", e)
+        self.samples.append(time.perf_counter() - started)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        s = sorted(self.samples)
+        return s[min(len(s) - 1, int(q * len(s)))]
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "ops": len(self.samples),
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "ops_per_s": round(len(self.samples) / elapsed, 1) if elapsed > 0 else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 2),
+            "p99_ms": round(self.quantile(0.99) * 1000, 2),
+            "max_ms": round(max(self.samples, default=0.0) * 1000, 2),
+        }
+
+
+def peak_rss_mb() -> float:
+    # на Linux ru_maxrss в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def drive(ops: int, concurrency: int, op: Callable[[int], Awaitable[Any]], rec: Recorder) -> float:
+    it = iter(range(ops))
+
+    async def worker():
+        for i in it:
+            await rec.timed(op(i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return time.perf_counter() - started
+
+
+async def setup_db(url: str, users: int, rnd: random.Random) -> Dict[int, List[str]]:
+    import asyncpg
+    import database
+
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        await conn.execute(USERS_TABLE)
+        population = {uid: rnd.choice(FILTER_MIX) for uid in range(1_000_001, 1_000_001 + users)}
+        await conn.copy_records_to_table(
+            "users", schema_name=BENCH_SCHEMA, columns=["telegram_id", "username", "subscribed", "filters"],
+            records=[(uid, f"bench{uid}", True, f) for uid, f in population.items()],
+        )
+    finally:
+        await conn.close()
+
+    pool = await asyncpg.create_pool(url, server_settings={"search_path": BENCH_SCHEMA})
+    await database._ensure_schema(pool)
+    database._db_pool = pool
+    return population
+
+
+async def scenario_cache(args, population: Dict[int, List[str]], rnd: random.Random) -> Recorder:
+    from services.cache import cache
+
+    user_ids = list(population)
+    rec = Recorder()
+
+    async def op(i: int):
+        filters = population[rnd.choice(user_ids)]
+        if rnd.random() < 0.6:
+            await cache.get_post(filters, period="week", random_order=True)
+        else:
+            await cache.get_post(filters, period=rnd.choice(("day", "week", "month")), random_order=False)
+
+    rec.elapsed = await drive(args.ops, args.concurrency, op, rec)
+    return rec
+
+
+async def scenario_buttons(args, population: Dict[int, List[str]], rnd: random.Random, bot, dp) -> Recorder:
+    from aiogram.types import Chat, Message, Update, User
+
+    user_ids = list(population)
+    texts = [t for t, w in BUTTON_MIX for _ in range(w)]
+    rec = Recorder()
+
+    async def op(i: int):
+        uid = rnd.choice(user_ids)
+        msg = Message(
+            message_id=i + 1,
+            date=datetime.now(),
+            chat=Chat(id=uid, type="private"),
+            from_user=User(id=uid, is_bot=False, first_name="bench", username=f"bench{uid}"),
+            text=rnd.choice(texts),
+        )
+        await dp.feed_update(bot, Update(update_id=i + 1, message=msg))
+
+    rec.elapsed = await drive(args.ops, args.concurrency, op, rec)
+    return rec
+
+
+async def scenario_broadcast(args, population: Dict[int, List[str]], rnd: random.Random, bot) -> Recorder:
+    import services.images as images
+
+    rec = Recorder()
+    send_post = images._send_post
+
+    async def timed_send_post(*a, **kw):
+        # send_one рассылки вызывает _send_post — меряем каждую отправку отдельно
+        started = time.perf_counter()
+        try:
+            return await send_post(*a, **kw)
+        finally:
+            rec.samples.append(time.perf_counter() - started)
+
+    images._send_post = timed_send_post
+    try:
+        started = time.perf_counter()
+        await images.send_image_toeveryone(bot, period="week")
+        rec.elapsed = time.perf_counter() - started
+    finally:
+        images._send_post = send_post
+    return rec
+
+
+def _configure_env(args) -> None:
+    for k, v in ENV_DEFAULTS.items():
+        os.environ.setdefault(k, v)
+    os.environ["GELBOORU_RATE"] = str(args.gelbooru_rate)
+    os.environ["GELBOORU_BURST"] = str(max(1, int(args.gelbooru_rate)))
+    os.environ["BROADCAST_RATE"] = str(args.broadcast_rate)
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    _configure_env(args)
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiohttp import TCPConnector
+
+    import database
+    import parsers.gelbooru as gelbooru
+    from config import HTTP_KEEPALIVE, TOKEN
+    from database.profiles import profiles
+    from database.seen import seen_posts
+    from handlers import router
+    from handlers.throttling import THROTTLE
+    from services.cache import cache
+    from services.coord import coord
+    from services.http import http_clients
+    from services.prefetch import prefetcher
+    from services.prepare import photos
+
+    rnd = random.Random(args.seed)
+    gel = FakeGelbooru(
+        posts=args.posts, latency_ms=args.api_latency, cdn_latency_ms=args.cdn_latency,
+        error_rate=args.api_429, media_kb=args.media_kb, seed=args.seed,
+    )
+    tg = FakeBotApi(latency_ms=args.tg_latency, error_rate=args.tg_429, blocked_rate=args.blocked, seed=args.seed)
+    await gel.start()
+    await tg.start()
+    gelbooru.BASE_URL = f"{gel.base_url}/index.php"
+    gelbooru.AUTHED = args.format == "json"
+
+    population = await setup_db(args.database_url, args.users, rnd)
+    await http_clients.start(
+        connector_factory=lambda limit, per_host: TCPConnector(
+            limit=limit, limit_per_host=per_host, keepalive_timeout=HTTP_KEEPALIVE
+        )
+    )
+    await profiles.start()
+    await seen_posts.start()
+    await coord.start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(tg.base_url)))
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    results = []
+    try:
+        for name in args.scenarios:
+            cache.clear()
+            gel.calls.clear()
+            tg.calls.clear()
+            THROTTLE.values.clear()
+            if name == "cache":
+                rec = await scenario_cache(args, population, rnd)
+            elif name == "buttons":
+                rec = await scenario_buttons(args, population, rnd, bot, dp)
+            else:
+                rec = await scenario_broadcast(args, population, rnd, bot)
+            snap = cache.snapshot()
+            results.append({
+                "scenario": name,
+                **rec.summary(rec.elapsed),
+                "peak_rss_mb": peak_rss_mb(),
+                "gelbooru": dict(gel.calls),
+                "telegram": dict(tg.calls),
+                "cache": {k: snap[k] for k in ("hits", "stale_hits", "misses", "refills", "api_calls_per_request")},
+                "throttle": _throttle_totals(THROTTLE),
+            })
+    finally:
+        await bot.session.close()
+        await prefetcher.close()
+        photos.close()
+        await profiles.close()
+        await seen_posts.close()
+        await coord.close()
+        await http_clients.close()
+        await database._db_pool.close()
+        await tg.close()
+        await gel.close()
+    return results
+
+
+def _throttle_totals(counter) -> Dict[str, int]:
+    # bot_throttle_total по всем действиям: passed / coalesced / throttled
+    totals: Dict[str, int] = {}
+    for (_, result), value in counter.values.items():
+        totals[result] = totals.get(result, 0) + int(value)
+    return totals
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print(f"{'scenario':<10} {'ops':>7} {'err':>5} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'RSS MB':>8}")
+    for r in results:
+        print(
+            f"{r['scenario']:<10} {r['ops']:>7} {r['errors']:>5} {r['ops_per_s']:>9} "
+            f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {r['peak_rss_mb']:>8}"
+        )
+    for r in results:
+        print(f"\n[{r['scenario']}] gelbooru={r['gelbooru']} telegram={r['telegram']} cache={r['cache']}")
+        if r["throttle"]:
+            print(f"[{r['scenario']}] throttle={r['throttle']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # choices здесь не годится: при nargs="*" argparse сверяет с ними и весь пустой список
+    ap.add_argument("scenarios", nargs="*", metavar="scenario", help=f"{', '.join(SCENARIOS)} (по умолчанию все)")
+    ap.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--users", type=int, default=2000, help="синтетических подписчиков")
+    ap.add_argument("--ops", type=int, default=2000, help="операций в сценариях cache/buttons")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--posts", type=int, default=20000, help="постов в базе фейкового Gelbooru")
+    ap.add_argument("--format", choices=("xml", "json"), default="xml", help="формат выдачи dapi")
+    ap.add_argument("--api-latency", type=float, default=80.0, help="средняя задержка dapi, мс")
+    ap.add_argument("--api-429", type=float, default=0.0, help="доля ответов 429 от dapi")
+    ap.add_argument("--cdn-latency", type=float, default=40.0, help="средняя задержка CDN, мс")
+    ap.add_argument("--media-kb", type=int, default=200, help="размер отдаваемого файла, КБ")
+    ap.add_argument("--tg-latency", type=float, default=50.0, help="средняя задержка Bot API, мс")
+    ap.add_argument("--tg-429", type=float, default=0.0, help="доля ответов 429 от Bot API")
+    ap.add_argument("--blocked", type=float, default=0.02, help="доля пользователей, заблокировавших бота")
+    ap.add_argument("--gelbooru-rate", type=float, default=1.0, help="GELBOORU_RATE, запросов/сек")
+    ap.add_argument("--broadcast-rate", type=float, default=25.0, help="BROADCAST_RATE, сообщений/сек")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", dest="json_out", help="куда сохранить результаты (для сравнения прогонов)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="логи бота уровня INFO")
+    args = ap.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        ap.error(f"неизвестные сценарии: {', '.join(unknown)}; есть {', '.join(SCENARIOS)}")
+    if not args.database_url:
+        ap.error("нужен Postgres: задайте DATABASE_URL или --database-url")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# bench/bench_parse.py
+"""
+Сравнение разбора страницы выдачи Gelbooru: старый путь (ET.fromstring / json + отдельная
+нормализация во вложенные dict) против потокового парсера из parsers/parse.py.
+Второй блок — разбор + фильтрация страницы под несколько наборов фильтров,
+то есть реальная стоимость страницы при пополнении кэша.
+
+Запуск из корня репозитория:
+    python -m bench.bench_parse                      # синтетические страницы по 100 постов
+    python -m bench.bench_parse --xml page.xml --json page.json   # записанные страницы
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from parsers.parse import JSON_BACKEND, parse_json_bytes, parse_xml_bytes, XmlPostParser
+from services.filters import compile_filters
+
+FILTER_SETS = [[], ["nsfw"], ["sfw", "gay"]]
+
+TAG_POOL = [f"tag_{i}" for i in range(3000)] + ["1girl", "solo", "highres", "long_hair", "smile"]
+EXTRA_FIELDS = ("width", "height", "score", "md5", "directory", "image", "change", "owner",
+                "creator_id", "parent_id", "sample", "preview_height", "preview_width", "source",
+                "title", "has_notes", "has_comments", "preview_url", "sample_height", "sample_width",
+                "status", "post_locked", "has_children")
+
+
+def _fake_post(i: int, rnd: random.Random) -> dict:
+    d = {
+        "id": str(9_000_000 + i),
+        "created_at": "Tue Oct 14 12:34:56 -0500 2025",
+        "file_url": f"https://img3.gelbooru.com/images/ab/cd/{i:032x}.jpg",
+        "sample_url": f"https://img3.gelbooru.com/samples/ab/cd/sample_{i:032x}.jpg",
+        "rating": rnd.choice(["general", "sensitive", "questionable", "explicit"]),
+        "tags": " ".join(rnd.sample(TAG_POOL, 40)),
+    }
+    for f in EXTRA_FIELDS:
+        d[f] = str(rnd.randint(0, 10**6))
+    return d
+
+
+def make_pages(n_pages: int, per_page: int = 100) -> tuple[list[bytes], list[bytes]]:
+    rnd = random.Random(42)
+    xml_pages, json_pages = [], []
+    for page in range(n_pages):
+        posts = [_fake_post(page * per_page + i, rnd) for i in range(per_page)]
+        body = "".join(
+            "<post " + " ".join(f"{k}={quoteattr(v)}" for k, v in p.items()) + "/>" for p in posts
+        )
+        xml_pages.append(f'<?xml version="1.0" encoding="UTF-8"?><posts count="1000" offset="0">{body}</posts>'.encode())
+        json_pages.append(json.dumps({"@attributes": {"limit": per_page}, "post": posts}).encode())
+    return xml_pages, json_pages
+
+
+# --- старая реализация (до потокового парсера), для сравнения ---
+
+def _old_normalize(p: dict) -> dict:
+    file_url = p.get("file_url") or p.get("sample_url") or ""
+    ext = (p.get("file_ext") or file_url.rsplit(".", 1)[-1] or "").lower()
+    rating_map = {"safe": "s", "s": "s", "questionable": "q", "q": "q", "explicit": "e", "e": "e"}
+    tags_val = p.get("tags") or []
+    tags_list = [t for t in tags_val.split() if t] if isinstance(tags_val, str) else list(tags_val)
+    return {
+        "id": str(p.get("id")),
+        "file": {"url": file_url, "ext": ext},
+        "rating": rating_map.get((p.get("rating") or "s").lower(), "s"),
+        "tags": {"general": tags_list},
+        "page_url": f"https://gelbooru.com/index.php?page=post&s=view&id={p.get('id')}",
+        "created_at": p.get("created_at"),
+    }
+
+
+def old_xml(data: bytes) -> list:
+    root = ET.fromstring(data.decode())
+    raw = [dict(node.attrib) for node in root.findall("post")]
+    return [_old_normalize(p) for p in raw if p.get("file_url") or p.get("sample_url")]
+
+
+def old_json(data: bytes) -> list:
+    d = json.loads(data.decode())
+    raw = [p for p in (d.get("post") or []) if isinstance(p, dict)]
+    return [_old_normalize(p) for p in raw if p.get("file_url") or p.get("sample_url")]
+
+
+def _old_is_post_allowed(post: dict, filters: list[str]) -> bool:
+    fset = {f.lower() for f in (filters or [])}
+    if post["file"]["ext"] not in {"jpg", "jpeg", "png", "gif", "webp", "mp4", "webm"}:
+        return False
+    tags: set[str] = set()
+    for v in post["tags"].values():
+        tags.update(x.lower() for x in v)
+    if {"gore", "feces", "urine", "diaper", "pregnant"} & tags:
+        return False
+    if "sfw" in fset:
+        if post["rating"] == "s":
+            return False
+    elif "nsfw" in fset:
+        if post["rating"] in {"e", "q"}:
+            return False
+    if "gay" in fset and "1girl" not in tags:
+        return False
+    return not (fset & tags)
+
+
+def _with_old_filters(parse):
+    def run(data: bytes) -> list:
+        posts = parse(data)
+        return [[p for p in posts if _old_is_post_allowed(p, f)] for f in FILTER_SETS]
+    return run
+
+
+def _with_new_filters(parse):
+    def run(data: bytes) -> list:
+        posts = parse(data)
+        return [compile_filters(f).apply(posts) for f in FILTER_SETS]
+    return run
+
+
+def new_xml_chunked(data: bytes, chunk: int = 32 * 1024) -> list:
+    parser = XmlPostParser()
+    for i in range(0, len(data), chunk):
+        parser.feed(data[i:i + chunk])
+    return parser.close()
+
+
+def measure(fn, pages: list[bytes], repeat: int) -> tuple[float, int, int]:
+    # время: лучший из повторов; память: пик одного прохода по всем страницам
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in pages:
+            fn(page)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    kept = [fn(page) for page in pages]   # результат держим, как буфер кэша
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best / len(pages), peak, sum(len(k) for k in kept)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--xml", nargs="*", default=[])
+    ap.add_argument("--json", nargs="*", default=[])
+    args = ap.parse_args()
+
+    if args.xml or args.json:
+        xml_pages = [open(p, "rb").read() for p in args.xml]
+        json_pages = [open(p, "rb").read() for p in args.json]
+    else:
+        xml_pages, json_pages = make_pages(args.pages)
+
+    cases = []
+    if xml_pages:
+        cases += [("xml  old (fromstring)", old_xml, xml_pages),
+                  ("xml  new (pull, whole)", parse_xml_bytes, xml_pages),
+                  ("xml  new (pull, 32K chunks)", new_xml_chunked, xml_pages)]
+    if json_pages:
+        cases += [("json old (json + dicts)", old_json, json_pages),
+                  (f"json new ({JSON_BACKEND})", parse_json_bytes, json_pages)]
+    n = len(FILTER_SETS)
+    if xml_pages:
+        cases += [(f"xml  old + {n} filters", _with_old_filters(old_xml), xml_pages),
+                  (f"xml  new + {n} filters", _with_new_filters(new_xml_chunked), xml_pages)]
+    if json_pages:
+        cases += [(f"json old + {n} filters", _with_old_filters(old_json), json_pages),
+                  (f"json new + {n} filters", _with_new_filters(parse_json_bytes), json_pages)]
+
+    print(f"{'case':30} {'ms/page':>9} {'peak KiB':>10} {'posts':>7}")
+    for name, fn, pages in cases:
+        per_page, peak, posts = measure(fn, pages, args.repeat)
+        print(f"{name:30} {per_page * 1000:9.2f} {peak / 1024:10.0f} {posts:7d}")
+
+
+if __name__ == "__main__":
+    main()
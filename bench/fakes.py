@@ -0,0 +1,260 @@
+# bench/fakes.py
+"""
+Локальные подставные серверы для нагрузочного прогона (bench/bench_load.py):
+
+- FakeGelbooru — dapi-выдача (XML и JSON) по синтетической базе постов плюс «CDN» с файлами.
+  Понимает теги, которые реально шлёт бот: -tag, tag, rating:/-rating:, id:>N, date:..,
+  sort:random/score/date/id:asc и pid. Задержка и доля ответов 429 настраиваются.
+- FakeBotApi — методы Bot API, которые вызывает бот (sendPhoto, sendMessage, sendDocument, ...).
+  Отвечает как Telegram, с настраиваемой задержкой, долей 429 (retry_after) и
+  «заблокировавших бота» пользователей (403).
+
+Оба сервера поднимаются на 127.0.0.1 на свободном порту и считают запросы.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+from xml.sax.saxutils import quoteattr
+
+from aiohttp import web
+
+TAG_POOL = [f"tag_{i}" for i in range(2000)] + [
+    "1girl", "solo", "highres", "smile", "yaoi", "trap", "male", "cat", "dog",
+    "gore", "lowres", "ai-generated", "jpeg_artifacts",
+]
+EXTS = ["jpg"] * 6 + ["png"] * 2 + ["gif", "mp4", "webm"]
+RATINGS = ["general", "sensitive", "questionable", "explicit"]
+
+
+async def _start_app(app: web.Application, host: str = "127.0.0.1") -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+async def _delay(mean_ms: float, rnd: random.Random) -> None:
+    if mean_ms > 0:
+        # экспоненциальный «хвост» задержки похож на реальную сеть больше, чем константа
+        await asyncio.sleep(rnd.expovariate(1000.0 / mean_ms))
+
+
+class FakeGelbooru:
+    def __init__(
+        self, posts: int = 20000, latency_ms: float = 0.0, cdn_latency_ms: float = 0.0,
+        error_rate: float = 0.0, media_kb: int = 200, seed: int = 1,
+    ):
+        self.latency_ms = latency_ms
+        self.cdn_latency_ms = cdn_latency_ms
+        self.error_rate = error_rate
+        self.media = bytes(random.Random(seed).getrandbits(8) for _ in range(1024)) * max(1, media_kb)
+        self.rnd = random.Random(seed)
+        self.base_url = ""
+        self.calls: Counter = Counter()
+        self._runner: web.AppRunner | None = None
+        self._posts = self._make_posts(posts, random.Random(seed))
+
+    @staticmethod
+    def _make_posts(n: int, rnd: random.Random) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        posts = []
+        for i in range(1, n + 1):
+            # id растёт со временем создания, как на настоящем сайте
+            created = now - timedelta(minutes=(n - i) * 60 * 24 * 60 // n)
+            tags = frozenset(rnd.sample(TAG_POOL, rnd.randint(10, 40)))
+            posts.append({
+                "id": i,
+                "created": created,
+                "created_at": created.strftime("%a %b %d %H:%M:%S -0000 %Y"),
+                "score": int(rnd.paretovariate(1.2) * 3),
+                "rating": rnd.choice(RATINGS),
+                "ext": rnd.choice(EXTS),
+                "tags": tags,
+                "tags_str": " ".join(sorted(tags)),
+            })
+        return posts
+
+    @lru_cache(maxsize=256)
+    def _select(self, tags: Tuple[str, ...]) -> Tuple[Dict[str, Any], ...]:
+        include, exclude = set(), set()
+        ratings_in, ratings_out = set(), set()
+        min_id, date_from, date_to, sort = 0, None, None, "id:desc"
+        for t in tags:
+            if t.startswith("sort:"):
+                sort = t[5:]
+            elif t.startswith("id:>"):
+                min_id = int(t[4:])
+            elif t.startswith("date:"):
+                v = t[5:]
+                if ".." in v:
+                    a, b = v.split("..", 1)
+                    date_from, date_to = a, b
+                elif v.startswith(">="):
+                    date_from = v[2:]
+                elif v.startswith("<="):
+                    date_to = v[2:]
+            elif t.startswith("-rating:"):
+                ratings_out.add(t[8:])
+            elif t.startswith("rating:"):
+                ratings_in.add(t[7:])
+            elif t.startswith("-"):
+                exclude.add(t[1:])
+            else:
+                include.add(t)
+        d_from = datetime.fromisoformat(date_from) if date_from else None
+        d_to = datetime.fromisoformat(date_to) + timedelta(days=1) if date_to else None
+
+        def rating_ok(r: str) -> bool:
+            short = "safe" if r in ("general", "sensitive") else r
+            if ratings_in and short not in ratings_in and r not in ratings_in:
+                return False
+            return short not in ratings_out and r not in ratings_out
+
+        out = [
+            p for p in self._posts
+            if p["id"] > min_id
+            and include <= p["tags"] and exclude.isdisjoint(p["tags"])
+            and rating_ok(p["rating"])
+            and (d_from is None or p["created"] >= d_from)
+            and (d_to is None or p["created"] < d_to)
+        ]
+        if sort == "score":
+            out.sort(key=lambda p: (-p["score"], -p["id"]))
+        elif sort == "id:asc":
+            out.sort(key=lambda p: p["id"])
+        elif sort != "random":
+            out.sort(key=lambda p: -p["id"])
+        return tuple(out)
+
+    def _post_dict(self, p: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            "id": str(p["id"]),
+            "created_at": p["created_at"],
+            "score": str(p["score"]),
+            "rating": p["rating"],
+            "tags": p["tags_str"],
+            "file_url": f"{self.base_url}/images/{p['id']}.{p['ext']}",
+            "sample_url": f"{self.base_url}/samples/{p['id']}.jpg",
+            "width": "2000", "height": "1500",
+            "md5": f"{p['id']:032x}",
+        }
+
+    async def _dapi(self, request: web.Request) -> web.Response:
+        q = request.query
+        self.calls["api"] += 1
+        await _delay(self.latency_ms, self.rnd)
+        if self.error_rate and self.rnd.random() < self.error_rate:
+            self.calls["api_429"] += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+
+        tags = tuple(q.get("tags", "").split())
+        limit = min(int(q.get("limit", 100)), 1000)
+        pid = int(q.get("pid", 0))
+        selected = self._select(tags)
+        if "sort:random" in tags:
+            page = self.rnd.sample(selected, min(limit, len(selected)))
+        else:
+            page = selected[pid * limit:(pid + 1) * limit]
+        posts = [self._post_dict(p) for p in page]
+
+        if q.get("json") == "1":
+            body = json.dumps({"@attributes": {"limit": limit, "offset": pid * limit, "count": len(selected)}, "post": posts})
+            return web.Response(text=body, content_type="application/json")
+        items = "".join("<post " + " ".join(f"{k}={quoteattr(v)}" for k, v in p.items()) + "/>" for p in posts)
+        body = f'<?xml version="1.0" encoding="UTF-8"?><posts count="{len(selected)}" offset="{pid * limit}">{items}</posts>'
+        return web.Response(text=body, content_type="application/xml")
+
+    async def _file(self, request: web.Request) -> web.Response:
+        self.calls["cdn"] += 1
+        await _delay(self.cdn_latency_ms, self.rnd)
+        ext = request.match_info["name"].rsplit(".", 1)[-1]
+        ctype = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "mp4": "video/mp4", "webm": "video/webm"}.get(ext, "application/octet-stream")
+        self.calls["cdn_bytes"] += len(self.media)
+        return web.Response(body=self.media, content_type=ctype)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/index.php", self._dapi)
+        app.router.add_get("/images/{name}", self._file)
+        app.router.add_get("/samples/{name}", self._file)
+        self._runner, self.base_url = await _start_app(app)
+        return self.base_url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeBotApi:
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, blocked_rate: float = 0.0, seed: int = 2):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.blocked_rate = blocked_rate
+        self.rnd = random.Random(seed)
+        self.base_url = ""
+        self.calls: Counter = Counter()
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+
+    def _blocked(self, chat_id: int) -> bool:
+        # детерминированно по id, чтобы повторная отправка тому же пользователю тоже падала
+        return self.blocked_rate > 0 and random.Random(chat_id).random() < self.blocked_rate
+
+    @staticmethod
+    def _error(code: int, description: str, **parameters: Any) -> web.Response:
+        body: Dict[str, Any] = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post() if request.content_type != "application/json" else await request.json()
+        self.calls[method] += 1
+        await _delay(self.latency_ms, self.rnd)
+
+        chat_id = int(data.get("chat_id", 0))
+        if self._blocked(chat_id):
+            self.calls["blocked"] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+        if self.error_rate and self.rnd.random() < self.error_rate:
+            self.calls["retry_after"] += 1
+            return self._error(429, "Too Many Requests: retry after 1", retry_after=1)
+
+        self._message_id += 1
+        msg: Dict[str, Any] = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        kind = method[4:].lower() if method.startswith("send") else ""
+        if kind in ("photo", "document", "animation", "video"):
+            media = data.get(kind)
+            # по file_id Telegram возвращает тот же file_id; загрузка получает новый
+            file_id = media if isinstance(media, str) else f"fake-{kind}-{self._message_id}"
+            if not isinstance(media, str):
+                self.calls["uploads"] += 1
+            obj = {"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1}
+            msg[kind] = [obj] if kind == "photo" else obj
+        elif method == "sendMessage":
+            msg["text"] = data.get("text", "")
+        else:
+            return web.json_response({"ok": True, "result": True})
+        return web.json_response({"ok": True, "result": msg})
+
+    async def start(self) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._method)
+        self._runner, self.base_url = await _start_app(app)
+        return self.base_url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
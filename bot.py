@@ -4,10 +4,18 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 
-from config import TOKEN    
-from database import init_db, get_db_pool
+from config import TOKEN, BOT_MODE
+from database import init_db, get_db_pool, close_db
 from handlers import router
 from scheduler import scheduler
+from services.http import http_clients
+from database.profiles import profiles
+from database.seen import seen_posts
+from services.metrics import metrics_server
+from services.webhook import WebhookServer
+from services.coord import coord
+from services.prefetch import prefetcher
+from services.prepare import photos
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
@@ -33,8 +41,34 @@ async def main():
     # Запуск планировщика задач
     asyncio.create_task(scheduler(bot))
 
-    # Запуск бота
-    await dp.start_polling(bot)
+    # Общие HTTP-пулы для API и CDN
+    await http_clients.start()
+
+    # Фоновая запись регистраций пользователей
+    await profiles.start()
+    await seen_posts.start()
+
+    # Координация с другими экземплярами (общий лимит к API, пулы, кулдауны)
+    await coord.start()
+
+    # Эндпоинт /metrics для Prometheus
+    await metrics_server.start()
+
+    # Запуск бота: webhook для прода, long polling — по умолчанию
+    try:
+        if BOT_MODE == "webhook":
+            await WebhookServer(bot, dp).serve()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await metrics_server.close()
+        await prefetcher.close()
+        photos.close()
+        await profiles.close()
+        await seen_posts.close()
+        await coord.close()
+        await http_clients.close()
+        await close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -10,6 +10,11 @@ CACHE_REFILL_SIZE = int(os.getenv("CACHE_REFILL_SIZE"))
 CACHE_TTL         = int(os.getenv("CACHE_TTL"))
 CACHE_MAX_KEYS    = int(os.getenv("CACHE_MAX_KEYS"))
 CACHE_MAX_PAGES   = int(os.getenv("CACHE_MAX_PAGES"))
+CACHE_STALE_SEC   = int(os.getenv("CACHE_STALE_SEC", "3600"))  # сколько после TTL ещё можно отдавать старое
+CACHE_POOL_MAX_POSTS = int(os.getenv("CACHE_POOL_MAX_POSTS", "600"))  # постов в одном общем пуле
+CACHE_POLL_SEC    = int(os.getenv("CACHE_POLL_SEC", "300"))   # как часто спрашивать новые посты для топа
+CACHE_RESCORE_SEC = int(os.getenv("CACHE_RESCORE_SEC", "1800")) # как часто обновлять score постов окна топа
+CACHE_MAX_MB      = int(os.getenv("CACHE_MAX_MB", "32"))      # общий бюджет памяти буферов и пулов
 
 # Сеть/агент/прокси
 USER_AGENT = os.getenv("USER_AGENT", "FurryTuesdayBot/1.0 (by @maksaucer)")
@@ -20,4 +25,89 @@ GELBOORU_USER_ID = os.getenv("GELBOORU_USER_ID")
 GELBOORU_API_KEY = os.getenv("GELBOORU_API_KEY")
 
 # (если используешь БД)
-DATABASE_URL = os.getenv("DATABASE_URL")
\ No newline at end of file
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# HTTP-клиенты (общие пулы соединений через прокси)
+HTTP_API_LIMIT          = int(os.getenv("HTTP_API_LIMIT", "10"))
+HTTP_API_LIMIT_PER_HOST = int(os.getenv("HTTP_API_LIMIT_PER_HOST", "4"))
+HTTP_CDN_LIMIT          = int(os.getenv("HTTP_CDN_LIMIT", "32"))
+HTTP_CDN_LIMIT_PER_HOST = int(os.getenv("HTTP_CDN_LIMIT_PER_HOST", "8"))
+HTTP_KEEPALIVE          = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL            = int(os.getenv("HTTP_DNS_TTL", "300"))
+
+# Кэш Telegram file_id (LRU в памяти перед таблицей media_file_ids)
+FILE_ID_LRU_SIZE = int(os.getenv("FILE_ID_LRU_SIZE", "5000"))
+
+# Рассылка
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_RATE    = float(os.getenv("BROADCAST_RATE", "25"))   # сообщений/сек на весь бот
+BROADCAST_BURST   = int(os.getenv("BROADCAST_BURST", "5"))
+SUBSCRIBERS_BATCH = int(os.getenv("SUBSCRIBERS_BATCH", "1000")) # подписчиков за один запрос при обходе
+
+# Планировщик (локальное время сервера; cron: минута час день месяц день_недели, 0 — воскресенье)
+SCHEDULE_BROADCAST     = os.getenv("SCHEDULE_BROADCAST", "0 12 * * 2")    # еженедельная рассылка (вторник)
+PREWARM_LEAD_MIN       = int(os.getenv("PREWARM_LEAD_MIN", "5"))          # за сколько минут до рассылки прогревать кэш (меньше CACHE_TTL)
+SCHEDULE_CATCHUP_HOURS = float(os.getenv("SCHEDULE_CATCHUP_HOURS", "24")) # пропущенный при простое слот догоняем, если он не старше
+SCHEDULER_TICK_SEC     = float(os.getenv("SCHEDULER_TICK_SEC", "30"))
+
+# Скачивание медиа
+MEDIA_MAX_MB   = int(os.getenv("MEDIA_MAX_MB", "50"))     # лимит Bot API на загрузку файла
+MEDIA_SPOOL_KB = int(os.getenv("MEDIA_SPOOL_KB", "1024")) # больше — пишем во временный файл
+
+# Подготовка фото: уменьшение больших оригиналов (нужен Pillow) в пуле процессов
+PHOTO_MAX_SIDE   = int(os.getenv("PHOTO_MAX_SIDE", "2560"))   # больше Telegram всё равно не покажет
+PHOTO_QUALITY    = int(os.getenv("PHOTO_QUALITY", "87"))      # качество JPEG после пережатия
+PREPARE_WORKERS  = int(os.getenv("PREPARE_WORKERS", "2"))     # процессов для пережатия
+PREPARE_CACHE_MB = int(os.getenv("PREPARE_CACHE_MB", "32"))   # кэш пережатых фото по id поста
+
+# Фоновая предзагрузка медиа для горячих буферов кэша
+PREFETCH_DEPTH       = int(os.getenv("PREFETCH_DEPTH", "3"))        # сколько следующих постов качать заранее (0 — выкл.)
+PREFETCH_HOT_KEYS    = int(os.getenv("PREFETCH_HOT_KEYS", "10"))    # сколько самых активных буферов считать горячими
+PREFETCH_MEM_MB      = int(os.getenv("PREFETCH_MEM_MB", "64"))      # бюджет предзагрузки в памяти
+PREFETCH_DISK_MB     = int(os.getenv("PREFETCH_DISK_MB", "512"))    # бюджет предзагрузки во временных файлах
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))  # одновременных фоновых скачиваний
+
+# Кэш профилей пользователей и отложенная регистрация
+PROFILE_TTL        = int(os.getenv("PROFILE_TTL", "300"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_FLUSH_SEC  = float(os.getenv("PROFILE_FLUSH_SEC", "2"))
+
+# Защита от частых нажатий (кулдаун на пользователя и класс действия, сек)
+THROTTLE_IMAGE_SEC   = float(os.getenv("THROTTLE_IMAGE_SEC", "1"))      # кнопки картинок: случайная и за период
+THROTTLE_FILTERS_SEC = float(os.getenv("THROTTLE_FILTERS_SEC", "0.5"))  # меню и переключатели фильтров
+
+# «Уже видел»: посты, которые пользователю не повторяем
+SEEN_CAPACITY   = int(os.getenv("SEEN_CAPACITY", "5000"))       # постов в поколении фильтра (помнится от 1x до 2x)
+SEEN_FP_RATE    = float(os.getenv("SEEN_FP_RATE", "0.01"))      # доля ложных «уже видел»
+SEEN_CACHE_SIZE = int(os.getenv("SEEN_CACHE_SIZE", "1000"))     # фильтров в памяти, ~12 КБ каждый при значениях выше
+SEEN_FLUSH_SEC  = float(os.getenv("SEEN_FLUSH_SEC", "10"))      # как часто писать изменённые фильтры в БД
+
+# Лимит запросов к Gelbooru (адаптивный, с приоритетами)
+GELBOORU_RATE     = float(os.getenv("GELBOORU_RATE", "1"))      # базовая скорость, запросов/сек
+GELBOORU_BURST    = int(os.getenv("GELBOORU_BURST", "1"))
+GELBOORU_MIN_RATE = float(os.getenv("GELBOORU_MIN_RATE", "0.2")) # нижняя граница при 429/503
+
+# Ранжирование «топа за период»
+RANKING_SCORER       = os.getenv("RANKING_SCORER", "penalized")   # raw | velocity | penalized
+RANKING_GRAVITY      = float(os.getenv("RANKING_GRAVITY", "1.5"))
+RANKING_PENALTY      = float(os.getenv("RANKING_PENALTY", "0.5"))   # множитель за каждый штрафной тег
+RANKING_PENALTY_TAGS = frozenset(
+    t.strip().lower() for t in os.getenv("RANKING_PENALTY_TAGS", "ai-generated,ai-assisted,lowres,jpeg_artifacts").split(",") if t.strip()
+)
+
+# Метрики (текстовый формат Prometheus на локальном порту; 0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Режим работы: polling (по умолчанию, для разработки) или webhook (за балансировщиком)
+BOT_MODE          = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL       = os.getenv("WEBHOOK_URL", "").strip()          # публичный https-адрес, без пути
+WEBHOOK_PATH      = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET    = os.getenv("WEBHOOK_SECRET", "").strip()       # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST      = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT      = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_DRAIN_SEC = float(os.getenv("WEBHOOK_DRAIN_SEC", "30"))   # сколько ждать начатые апдейты при остановке
+
+# Координация нескольких экземпляров: local (один процесс) или postgres (общий лимит, пулы, кулдауны)
+COORD_BACKEND            = os.getenv("COORD_BACKEND", "local").strip().lower()
+COORD_PAGE_RETENTION_SEC = int(os.getenv("COORD_PAGE_RETENTION_SEC", "86400"))  # сколько хранить общие страницы пулов
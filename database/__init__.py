@@ -3,21 +3,125 @@ import asyncpg
 import os
 from dotenv import load_dotenv
 
+from services.metrics import registry
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 _db_pool = None
 
+# Служебные таблицы бота (таблица users создаётся вручную)
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS media_file_ids (
+        post_id    TEXT NOT NULL,
+        kind       TEXT NOT NULL,
+        file_id    TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (post_id, kind)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_progress (
+        broadcast_id TEXT PRIMARY KEY,
+        cursor       BIGINT NOT NULL DEFAULT 0,
+        total        INTEGER NOT NULL DEFAULT 0,
+        sent         INTEGER NOT NULL DEFAULT 0,
+        failed       INTEGER NOT NULL DEFAULT 0,
+        blocked      INTEGER NOT NULL DEFAULT 0,
+        started_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+        finished_at  TIMESTAMPTZ
+    )
+    """,
+    # планировщик: последний взятый слот каждого задания (database/schedule.py)
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_jobs (
+        name        TEXT PRIMARY KEY,
+        slot        TIMESTAMPTZ NOT NULL,
+        started_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+        lease_until TIMESTAMPTZ NOT NULL,
+        finished_at TIMESTAMPTZ,
+        error       TEXT
+    )
+    """,
+    # «уже видел»: Bloom-фильтры пользователей (database/seen.py)
+    """
+    CREATE TABLE IF NOT EXISTS user_seen (
+        telegram_id BIGINT PRIMARY KEY,
+        data        BYTEA NOT NULL,
+        updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    # координация нескольких экземпляров (COORD_BACKEND=postgres)
+    """
+    CREATE TABLE IF NOT EXISTS coord_buckets (
+        name         TEXT PRIMARY KEY,
+        tokens       DOUBLE PRECISION NOT NULL,
+        updated_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+        paused_until TIMESTAMPTZ NOT NULL DEFAULT 'epoch'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coord_cooldowns (
+        key   TEXT PRIMARY KEY,
+        until TIMESTAMPTZ NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coord_locks (
+        key   TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        until TIMESTAMPTZ NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coord_pages (
+        seq        BIGSERIAL PRIMARY KEY,
+        pool_key   TEXT NOT NULL,
+        meta       JSONB NOT NULL,
+        posts      JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS coord_pages_pool_key_seq ON coord_pages (pool_key, seq)",
+    "CREATE INDEX IF NOT EXISTS coord_pages_created_at ON coord_pages (created_at)",
+]
+
+async def _ensure_schema(pool):
+    async with pool.acquire() as conn:
+        for stmt in SCHEMA:
+            await conn.execute(stmt)
+
 async def init_db():
     global _db_pool
     if _db_pool is None:
         try:
             _db_pool = await asyncpg.create_pool(DATABASE_URL)
+            await _ensure_schema(_db_pool)
             print("Database connection pool initialized successfully.")
         except Exception as e:
             print(f"Failed to initialize database pool: {e}")
             _db_pool = None
 
+async def close_db():
+    global _db_pool
+    if _db_pool is not None:
+        await _db_pool.close()
+        _db_pool = None
+
+DB_POOL = registry.gauge("bot_db_pool_connections", "Соединения пула asyncpg", ("state",))
+
+@registry.collector
+def _collect_db_pool():
+    if _db_pool is None:
+        return
+    size, idle = _db_pool.get_size(), _db_pool.get_idle_size()
+    DB_POOL.set(size, "open")
+    DB_POOL.set(idle, "idle")
+    DB_POOL.set(size - idle, "in_use")
+    DB_POOL.set(_db_pool.get_max_size(), "max")
+
 def get_db_pool():
     if _db_pool is None:
         raise RuntimeError("Database pool has not been initialized. Call init_db() first.")
@@ -0,0 +1,40 @@
+# database/broadcasts.py
+from database import get_db_pool
+
+async def get_progress(broadcast_id: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(
+            "SELECT * FROM broadcast_progress WHERE broadcast_id = $1", broadcast_id
+        )
+
+async def start_progress(broadcast_id: str, total: int):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO broadcast_progress (broadcast_id, total)
+            VALUES ($1, $2)
+            ON CONFLICT (broadcast_id) DO NOTHING
+        """, broadcast_id, total)
+
+async def save_progress(broadcast_id: str, cursor: int, sent: int, failed: int, blocked: int):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE broadcast_progress
+            SET cursor = GREATEST(cursor, $2),
+                sent = $3,
+                failed = $4,
+                blocked = $5,
+                updated_at = now()
+            WHERE broadcast_id = $1
+        """, broadcast_id, cursor, sent, failed, blocked)
+
+async def finish_progress(broadcast_id: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE broadcast_progress
+            SET finished_at = now(), updated_at = now()
+            WHERE broadcast_id = $1
+        """, broadcast_id)
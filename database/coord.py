@@ -0,0 +1,119 @@
+# database/coord.py
+# Координация нескольких экземпляров бота через общий Postgres (см. services/coord.py)
+import json
+from typing import Any, Dict, List, Tuple
+
+from database import get_db_pool
+
+async def take_token(name: str, rate: float, burst: int) -> float:
+    """Берёт токен из общего ведра. 0 — выдан, иначе через сколько секунд пробовать снова."""
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        wait = await conn.fetchval("""
+            WITH b AS (
+                SELECT name,
+                       LEAST($3::float8, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8 * $2) AS avail,
+                       paused_until
+                FROM coord_buckets WHERE name = $1
+                FOR UPDATE
+            ), taken AS (
+                UPDATE coord_buckets c
+                SET tokens = b.avail - 1, updated_at = clock_timestamp()
+                FROM b
+                WHERE c.name = b.name AND b.avail >= 1 AND b.paused_until <= clock_timestamp()
+                RETURNING 1
+            )
+            SELECT CASE WHEN EXISTS (SELECT 1 FROM taken) THEN 0.0
+                        ELSE GREATEST(EXTRACT(EPOCH FROM b.paused_until - clock_timestamp())::float8,
+                                      (1 - b.avail) / $2, 0.01)
+                   END
+            FROM b
+        """, name, rate, burst)
+        if wait is None:
+            # ведра ещё нет — создаём полным и пробуем снова
+            await conn.execute("""
+                INSERT INTO coord_buckets (name, tokens) VALUES ($1, $2)
+                ON CONFLICT (name) DO NOTHING
+            """, name, float(burst))
+            return 0.0 if burst >= 1 else 1.0 / rate
+        return wait
+
+async def pause_bucket(name: str, seconds: float):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE coord_buckets
+            SET paused_until = GREATEST(paused_until, clock_timestamp() + make_interval(secs => $2)),
+                tokens = 0
+            WHERE name = $1
+        """, name, seconds)
+
+async def try_cooldown(key: str, seconds: float) -> float:
+    """Ставит кулдаун, если его нет. 0 — поставлен, иначе сколько секунд ещё осталось."""
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        taken = await conn.fetchval("""
+            INSERT INTO coord_cooldowns (key, until)
+            VALUES ($1, clock_timestamp() + make_interval(secs => $2))
+            ON CONFLICT (key) DO UPDATE SET until = EXCLUDED.until
+            WHERE coord_cooldowns.until <= clock_timestamp()
+            RETURNING 1
+        """, key, seconds)
+        if taken:
+            return 0.0
+        left = await conn.fetchval(
+            "SELECT EXTRACT(EPOCH FROM until - clock_timestamp())::float8 FROM coord_cooldowns WHERE key = $1", key
+        )
+        return max(0.0, left or 0.0)
+
+async def try_lock(key: str, owner: str, lease_sec: float) -> bool:
+    """
+    Берёт блокировку-аренду на ключ, если она свободна или её аренда истекла. В отличие от
+    advisory lock соединение держится только на время запроса, а не всей загрузки страницы.
+    """
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        taken = await conn.fetchval("""
+            INSERT INTO coord_locks (key, owner, until)
+            VALUES ($1, $2, clock_timestamp() + make_interval(secs => $3))
+            ON CONFLICT (key) DO UPDATE SET owner = EXCLUDED.owner, until = EXCLUDED.until
+            WHERE coord_locks.until <= clock_timestamp()
+            RETURNING 1
+        """, key, owner, lease_sec)
+        return bool(taken)
+
+async def unlock(key: str, owner: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM coord_locks WHERE key = $1 AND owner = $2", key, owner)
+
+async def publish_page(pool_key: str, meta: Dict[str, Any], posts: List[Dict[str, Any]]) -> int:
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval("""
+            INSERT INTO coord_pages (pool_key, meta, posts)
+            VALUES ($1, $2::jsonb, $3::jsonb)
+            RETURNING seq
+        """, pool_key, json.dumps(meta), json.dumps(posts))
+
+async def read_pages(
+    pool_key: str, after_seq: int, max_age_sec: float | None = None
+) -> List[Tuple[int, Dict[str, Any], List[Dict[str, Any]]]]:
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT seq, meta, posts FROM coord_pages
+            WHERE pool_key = $1 AND seq > $2
+              AND ($3::float8 IS NULL OR created_at > now() - make_interval(secs => $3))
+            ORDER BY seq
+        """, pool_key, after_seq, max_age_sec)
+        return [(row["seq"], json.loads(row["meta"]), json.loads(row["posts"])) for row in rows]
+
+async def cleanup(page_retention_sec: float):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM coord_pages WHERE created_at < now() - make_interval(secs => $1)", page_retention_sec
+        )
+        await conn.execute("DELETE FROM coord_cooldowns WHERE until < clock_timestamp()")
+        await conn.execute("DELETE FROM coord_locks WHERE until < clock_timestamp()")
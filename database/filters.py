@@ -1,5 +1,6 @@
 # database/filters.py
 from database import get_db_pool
+from database.profiles import profiles
 
 async def get_filters(user_id: int) -> list[str]:
     pool = get_db_pool()
@@ -29,6 +30,7 @@ async def add_filter(user_id: int, tag: str):
                 """,
                 [tag], user_id
             )
+    profiles.invalidate(user_id)
 
 async def remove_filter(user_id: int, tag: str):
     pool = get_db_pool()
@@ -36,4 +38,5 @@ async def remove_filter(user_id: int, tag: str):
         await conn.execute(
             "UPDATE users SET filters = ARRAY(SELECT unnest(filters) EXCEPT SELECT $1) WHERE telegram_id = $2",
             tag, user_id
-        )
\ No newline at end of file
+        )
+    profiles.invalidate(user_id)
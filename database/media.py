@@ -0,0 +1,28 @@
+# database/media.py
+from database import get_db_pool
+
+async def get_file_ids(post_id: str) -> dict[str, str]:
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT kind, file_id FROM media_file_ids WHERE post_id = $1", post_id
+        )
+        return {row["kind"]: row["file_id"] for row in rows}
+
+async def save_file_id(post_id: str, kind: str, file_id: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO media_file_ids (post_id, kind, file_id)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (post_id, kind) DO UPDATE
+            SET file_id = EXCLUDED.file_id,
+                created_at = now()
+        """, post_id, kind, file_id)
+
+async def delete_file_id(post_id: str, kind: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM media_file_ids WHERE post_id = $1 AND kind = $2", post_id, kind
+        )
@@ -0,0 +1,134 @@
+# database/profiles.py
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable
+
+from config import PROFILE_TTL, PROFILE_CACHE_SIZE, PROFILE_FLUSH_SEC
+from database import get_db_pool
+
+
+class UserProfile:
+    __slots__ = ("user_id", "username", "subscribed", "filters", "expires_at")
+
+    def __init__(self, user_id: int, username: str | None, subscribed: bool, filters: list[str], ttl: int):
+        self.user_id = user_id
+        self.username = username
+        self.subscribed = subscribed
+        self.filters = filters
+        self.expires_at = time.time() + ttl
+
+
+class ProfileCache:
+    """
+    Кэш профилей пользователей (username, подписка, фильтры) с TTL и явной инвалидацией.
+    Регистрация — write-behind: upsert копится в памяти и пишется пачкой в фоне,
+    причём только если что-то действительно поменялось.
+    """
+
+    def __init__(self, ttl: int, max_size: int, flush_sec: float):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.flush_sec = flush_sec
+        self._profiles: OrderedDict[int, UserProfile] = OrderedDict()
+        self._pending: Dict[int, str | None] = {}
+        self._flusher: asyncio.Task | None = None
+        self._write_lock = asyncio.Lock()    # flush и прямые записи (отписка, удаление) не перекрываются
+
+    def _remember(self, profile: UserProfile) -> None:
+        self._profiles[profile.user_id] = profile
+        self._profiles.move_to_end(profile.user_id, last=True)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    async def get(self, user_id: int) -> UserProfile | None:
+        profile = self._profiles.get(user_id)
+        if profile is not None and time.time() < profile.expires_at:
+            self._profiles.move_to_end(user_id, last=True)
+            return profile
+        pool = get_db_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT username, subscribed, filters FROM users WHERE telegram_id = $1", user_id
+            )
+        if row is None:
+            self._profiles.pop(user_id, None)
+            return None
+        profile = UserProfile(user_id, row["username"], bool(row["subscribed"]), list(row["filters"] or []), self.ttl)
+        self._remember(profile)
+        return profile
+
+    def invalidate(self, user_id: int) -> None:
+        self._profiles.pop(user_id, None)
+
+    @asynccontextmanager
+    async def overriding(self, user_ids: Iterable[int]) -> AsyncIterator[None]:
+        """
+        Прямая запись пользователей мимо write-behind (отписка, удаление). Ждёт идущий flush,
+        иначе его upsert с subscribed = TRUE лёг бы поверх отписки, и отменяет их отложенную
+        регистрацию (в том числе вернувшуюся в очередь после неудачного flush).
+        """
+        user_ids = list(user_ids)
+        async with self._write_lock:
+            for user_id in user_ids:
+                self._pending.pop(user_id, None)
+            yield
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    def register(self, user_id: int, username: str | None) -> None:
+        """Аналог add_user, но отложенный: пишет только если пользователь новый, отписан или сменил username."""
+        profile = self._profiles.get(user_id)
+        if profile is not None and profile.subscribed and profile.username == username:
+            return
+        self._pending[user_id] = username
+        if profile is None:
+            self._remember(UserProfile(user_id, username, True, [], self.ttl))
+        else:
+            profile.username = username
+            profile.subscribed = True
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = {}
+        try:
+            pool = get_db_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany("""
+                    INSERT INTO users (telegram_id, username, subscribed, filters)
+                    VALUES ($1, $2, TRUE, '{}')
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET username = EXCLUDED.username,
+                        subscribed = TRUE,
+                        filters = COALESCE(users.filters, '{}')
+                """, list(batch.items()))
+        except Exception as e:
+            logging.warning("profile flush failed (%d users), will retry: %s", len(batch), e)
+            for user_id, username in batch.items():
+                self._pending.setdefault(user_id, username)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+profiles = ProfileCache(ttl=PROFILE_TTL, max_size=PROFILE_CACHE_SIZE, flush_sec=PROFILE_FLUSH_SEC)
@@ -0,0 +1,55 @@
+# database/schedule.py
+# Запуски заданий планировщика (scheduler.py): одна строка на задание — последний взятый слот
+from datetime import datetime
+
+from database import get_db_pool
+
+async def get_job(name: str):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(
+            "SELECT name, slot, finished_at, lease_until < now() AS lease_expired FROM scheduler_jobs WHERE name = $1",
+            name,
+        )
+
+async def claim_run(name: str, slot: datetime, lease_sec: float) -> bool:
+    """
+    Забирает слот задания. Удаётся ровно одному процессу: либо слот новее последнего,
+    либо тот же слот не был завершён, а аренда взявшего его процесса истекла (процесс упал).
+    """
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        claimed = await conn.fetchval("""
+            INSERT INTO scheduler_jobs (name, slot, started_at, lease_until)
+            VALUES ($1, $2, now(), now() + make_interval(secs => $3))
+            ON CONFLICT (name) DO UPDATE
+            SET slot = EXCLUDED.slot,
+                started_at = EXCLUDED.started_at,
+                lease_until = EXCLUDED.lease_until,
+                finished_at = NULL,
+                error = NULL
+            WHERE scheduler_jobs.slot < EXCLUDED.slot
+               OR (scheduler_jobs.slot = EXCLUDED.slot
+                   AND scheduler_jobs.finished_at IS NULL
+                   AND scheduler_jobs.lease_until < now())
+            RETURNING 1
+        """, name, slot, lease_sec)
+        return bool(claimed)
+
+async def renew_lease(name: str, slot: datetime, lease_sec: float):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE scheduler_jobs
+            SET lease_until = now() + make_interval(secs => $3)
+            WHERE name = $1 AND slot = $2 AND finished_at IS NULL
+        """, name, slot, lease_sec)
+
+async def finish_run(name: str, slot: datetime, error: str | None = None):
+    pool = get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE scheduler_jobs
+            SET finished_at = now(), error = $3
+            WHERE name = $1 AND slot = $2
+        """, name, slot, error)
@@ -0,0 +1,178 @@
+# database/seen.py
+import asyncio
+import hashlib
+import logging
+import math
+import struct
+from collections import OrderedDict
+from typing import Dict, List
+
+from config import SEEN_CAPACITY, SEEN_FP_RATE, SEEN_CACHE_SIZE, SEEN_FLUSH_SEC
+from database import get_db_pool
+
+_HEADER = struct.Struct("<BBII")   # версия, k, байт на поколение, добавлено в текущее
+_VERSION = 1
+
+
+class SeenFilter:
+    """
+    «Уже видел» одного пользователя: два поколения Bloom-фильтра фиксированного размера.
+    Когда в текущее добавлено capacity постов, оно становится предыдущим, а старое
+    предыдущее выбрасывается, так что память не растёт с историей (помнятся последние
+    capacity..2*capacity постов). Ложные срабатывания возможны (пост ошибочно сочтён виденным),
+    пропуски — нет.
+    """
+
+    __slots__ = ("k", "nbytes", "capacity", "added", "current", "previous")
+
+    def __init__(self, capacity: int, fp_rate: float):
+        bits = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.k = max(1, round(bits / capacity * math.log(2)))
+        self.nbytes = (bits + 7) // 8
+        self.capacity = capacity
+        self.added = 0
+        self.current = bytearray(self.nbytes)
+        self.previous = bytearray(self.nbytes)
+
+    def _positions(self, post_id: int):
+        # двойное хеширование: k позиций из одного 128-битного хеша
+        digest = hashlib.blake2b(post_id.to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.nbytes * 8
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    @staticmethod
+    def _has(bits: bytearray, positions) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def __contains__(self, post_id: int) -> bool:
+        positions = self._positions(post_id)
+        return self._has(self.current, positions) or self._has(self.previous, positions)
+
+    def add(self, post_id: int) -> None:
+        positions = self._positions(post_id)
+        if self._has(self.current, positions):
+            return
+        if self.added >= self.capacity:
+            self.previous, self.current = self.current, bytearray(self.nbytes)
+            self.added = 0
+        for p in positions:
+            self.current[p >> 3] |= 1 << (p & 7)
+        self.added += 1
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_VERSION, self.k, self.nbytes, self.added) + bytes(self.current) + bytes(self.previous)
+
+    def load(self, data: bytes) -> bool:
+        """Восстанавливает состояние из to_bytes(); False, если формат или размер не совпадают с текущими настройками."""
+        if len(data) < _HEADER.size:
+            return False
+        version, k, nbytes, added = _HEADER.unpack_from(data)
+        if version != _VERSION or k != self.k or nbytes != self.nbytes or len(data) != _HEADER.size + 2 * nbytes:
+            return False
+        body = data[_HEADER.size:]
+        self.current = bytearray(body[:nbytes])
+        self.previous = bytearray(body[nbytes:])
+        self.added = added
+        return True
+
+
+class SeenStore:
+    """
+    Фильтры «уже видел» по пользователям: LRU в памяти перед таблицей user_seen.
+    Один запрос к БД на пользователя при первом обращении; дальше проверка поста — только
+    в памяти. Изменения пишутся пачкой в фоне (write-behind), как регистрации в профилях.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float, max_size: int, flush_sec: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.max_size = max_size
+        self.flush_sec = flush_sec
+        self._filters: OrderedDict[int, SeenFilter] = OrderedDict()
+        self._dirty: Dict[int, SeenFilter] = {}   # держит фильтр до записи, даже если он ушёл из LRU
+        self._locks: Dict[int, List] = {}          # user_id -> [Lock, число ожидающих]
+        self._flusher: asyncio.Task | None = None
+
+    def _remember(self, user_id: int, seen: SeenFilter) -> None:
+        self._filters[user_id] = seen
+        self._filters.move_to_end(user_id, last=True)
+        while len(self._filters) > self.max_size:
+            self._filters.popitem(last=False)
+
+    async def _load(self, user_id: int) -> SeenFilter:
+        seen = SeenFilter(self.capacity, self.fp_rate)
+        try:
+            pool = get_db_pool()
+            async with pool.acquire() as conn:
+                data = await conn.fetchval("SELECT data FROM user_seen WHERE telegram_id = $1", user_id)
+            if data is not None and not seen.load(data):
+                logging.info("seen filter of user %s has another size, starting empty", user_id)
+        except Exception as e:
+            logging.warning("seen filter load failed for user %s: %s", user_id, e)
+        return seen
+
+    async def get(self, user_id: int) -> SeenFilter:
+        seen = self._filters.get(user_id) or self._dirty.get(user_id)
+        if seen is None:
+            # параллельные клики одного пользователя не должны загрузить фильтр дважды;
+            # замок убираем, только когда его не ждёт никто (сразу после release он уже
+            # не locked(), но разбуженный ожидающий ещё не успел его взять)
+            entry = self._locks.get(user_id)
+            if entry is None:
+                entry = self._locks[user_id] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    seen = self._filters.get(user_id) or self._dirty.get(user_id)
+                    if seen is None:
+                        seen = await self._load(user_id)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(user_id, None)
+        self._remember(user_id, seen)
+        return seen
+
+    async def add(self, user_id: int, post_id: int) -> None:
+        seen = await self.get(user_id)
+        seen.add(post_id)
+        self._dirty[user_id] = seen
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        batch = self._dirty
+        self._dirty = {}
+        try:
+            pool = get_db_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany("""
+                    INSERT INTO user_seen (telegram_id, data, updated_at)
+                    VALUES ($1, $2, now())
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+                """, [(user_id, seen.to_bytes()) for user_id, seen in batch.items()])
+        except Exception as e:
+            logging.warning("seen flush failed (%d users), will retry: %s", len(batch), e)
+            for user_id, seen in batch.items():
+                self._dirty.setdefault(user_id, seen)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+seen_posts = SeenStore(capacity=SEEN_CAPACITY, fp_rate=SEEN_FP_RATE, max_size=SEEN_CACHE_SIZE, flush_sec=SEEN_FLUSH_SEC)
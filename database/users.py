@@ -1,6 +1,9 @@
 # database/users.py
+from typing import AsyncIterator
 
+from config import SUBSCRIBERS_BATCH
 from database import get_db_pool
+from database.profiles import profiles
 
 async def get_username(user_id: int):
     pool = get_db_pool()
@@ -25,34 +28,79 @@ async def add_user(user_id: int, username: str = "UNIDENTIFIED"):
                 subscribed = TRUE,
                 filters = COALESCE(users.filters, '{}')
         """, user_id, username)
+    profiles.invalidate(user_id)
 
-async def unsubscribe_user(user_id: int):
+async def unsubscribe_user(user_id: int, username: str | None = None):
     pool = get_db_pool()
     if pool is None:
         raise Exception("Database pool is not initialized.")
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            UPDATE users
-            SET subscribed = FALSE
-            WHERE telegram_id = $1
-        """, user_id)
+    async with profiles.overriding([user_id]):
+        async with pool.acquire() as conn:
+            # новый пользователь мог отписаться раньше, чем его регистрация дошла до БД
+            await conn.execute("""
+                INSERT INTO users (telegram_id, username, subscribed, filters)
+                VALUES ($1, $2, FALSE, '{}')
+                ON CONFLICT (telegram_id) DO UPDATE
+                SET subscribed = FALSE,
+                    username = COALESCE(EXCLUDED.username, users.username)
+            """, user_id, username)
 
 async def remove_user(user_id: int):
     pool = get_db_pool()
     if pool is None:
         raise Exception("Database pool is not initialized.")
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            DELETE FROM users WHERE telegram_id = $1
-        """, user_id)
+    async with profiles.overriding([user_id]):
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                DELETE FROM users WHERE telegram_id = $1
+            """, user_id)
 
-async def load_users():
+async def count_subscribers(after_id: int = 0) -> int:
     pool = get_db_pool()
     if pool is None:
         raise Exception("Database pool is not initialized.")
     async with pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT telegram_id FROM users
-            WHERE subscribed = TRUE
-        """)
-        return [row["telegram_id"] for row in rows]
\ No newline at end of file
+        return await conn.fetchval(
+            "SELECT count(*) FROM users WHERE subscribed = TRUE AND telegram_id > $1", after_id
+        )
+
+async def iter_subscribers(
+    after_id: int = 0, batch_size: int = SUBSCRIBERS_BATCH
+) -> AsyncIterator[list[tuple[int, list[str]]]]:
+    """
+    Подписчики с фильтрами пачками по возрастанию id (на этом держится курсор прогресса рассылки).
+    Keyset-пагинация: следующая пачка — после последнего id предыдущей, один запрос на пачку;
+    соединение между пачками возвращается в пул, пока вызывающий их обрабатывает.
+    """
+    pool = get_db_pool()
+    if pool is None:
+        raise Exception("Database pool is not initialized.")
+    while True:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT telegram_id, filters FROM users
+                WHERE subscribed = TRUE AND telegram_id > $1
+                ORDER BY telegram_id
+                LIMIT $2
+            """, after_id, batch_size)
+        if not rows:
+            return
+        yield [(row["telegram_id"], list(row["filters"] or [])) for row in rows]
+        if len(rows) < batch_size:
+            return
+        after_id = rows[-1]["telegram_id"]
+
+async def unsubscribe_users(user_ids: list[int]):
+    """Отписка пачкой (заблокировавшие бота по итогам рассылки) — один запрос на всю пачку."""
+    if not user_ids:
+        return
+    pool = get_db_pool()
+    if pool is None:
+        raise Exception("Database pool is not initialized.")
+    async with profiles.overriding(user_ids):
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE users
+                SET subscribed = FALSE
+                WHERE telegram_id = ANY($1::bigint[]) AND subscribed = TRUE
+            """, user_ids)
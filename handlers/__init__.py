@@ -4,8 +4,12 @@ from aiogram import Router
 from .start import router as start_router
 from .buttons import router as buttons_router
 from .callbacks import router as callbacks_router
+from .throttling import throttling
 
 router = Router()
+# внутренние middleware корневого роутера действуют и на вложенные
+router.message.middleware(throttling)
+router.callback_query.middleware(throttling)
 router.include_router(start_router)
 router.include_router(buttons_router)
 router.include_router(callbacks_router)
@@ -0,0 +1,95 @@
+#handlers/throttling.py
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import THROTTLE_IMAGE_SEC, THROTTLE_FILTERS_SEC
+from services.coord import coord
+from services.metrics import registry
+
+THROTTLE = registry.counter(
+    "bot_throttle_total", "Действия пользователей: passed, coalesced (дубль уже выполняется), throttled", ("action", "result")
+)
+
+# кнопка -> (класс действия, действие). Кулдаун — на класс, склейка дублей — на действие
+BUTTON_ACTIONS: Dict[str, Tuple[str, str]] = {
+    "🎲 Случайная картинка": ("image", "random"),
+    "🥉 За день": ("image", "top:day"),
+    "🥈 За неделю": ("image", "top:week"),
+    "🥇 За месяц": ("image", "top:month"),
+    "⚙️ Фильтры": ("filters", "filters:menu"),
+}
+
+COOLDOWNS: Dict[str, float] = {
+    "image": THROTTLE_IMAGE_SEC,
+    "filters": THROTTLE_FILTERS_SEC,
+}
+
+
+def classify(event: TelegramObject) -> Tuple[str, str] | None:
+    if isinstance(event, Message):
+        return BUTTON_ACTIONS.get(event.text or "")
+    if isinstance(event, CallbackQuery) and (event.data or "").startswith("toggle_"):
+        return "filters", f"filters:{event.data}"
+    return None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита обработчиков от частых нажатий: кулдаун на пользователя и класс действия
+    (хранится в services/coord — с истечением и ограничением размера, общий для экземпляров
+    при COORD_BACKEND=postgres) и склейка дублей: пока действие пользователя выполняется,
+    повторные такие же нажатия не запускают второй конвейер скачивания и отправки.
+    """
+
+    def __init__(self, cooldowns: Dict[str, float]):
+        self.cooldowns = cooldowns
+        self._inflight: Set[Tuple[int, str]] = set()   # ограничено числом одновременно идущих обработчиков
+
+    @staticmethod
+    async def _notify(event: TelegramObject, remaining: float) -> None:
+        text = f"⏳ Подожди {int(remaining) + 1} сек перед следующим запросом!"
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(text)
+            elif isinstance(event, Message):
+                await event.answer(text)
+        except Exception as e:
+            logging.info("throttle notice failed: %s", e)
+
+    async def __call__(
+        self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        action = classify(event)
+        user = data.get("event_from_user")
+        if action is None or user is None:
+            return await handler(event, data)
+        action_class, name = action
+        key = (user.id, name)
+
+        if key in self._inflight:
+            THROTTLE.inc(name, "coalesced")
+            if isinstance(event, CallbackQuery):
+                await event.answer()    # иначе у пользователя будут «часики» на кнопке
+            return None
+
+        cooldown = self.cooldowns.get(action_class, 0.0)
+        if cooldown > 0:
+            remaining = await coord.cooldown(f"{action_class}:{user.id}", cooldown)
+            if remaining > 0:
+                THROTTLE.inc(name, "throttled")
+                await self._notify(event, remaining)
+                return None
+
+        THROTTLE.inc(name, "passed")
+        self._inflight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._inflight.discard(key)
+
+
+throttling = ThrottlingMiddleware(COOLDOWNS)
@@ -0,0 +1,88 @@
+# parsers/models.py
+import sys
+from enum import Enum
+from typing import Iterable
+
+
+class Rating(str, Enum):
+    SAFE = "s"
+    QUESTIONABLE = "q"
+    EXPLICIT = "e"
+
+    @classmethod
+    def parse(cls, raw: str | None) -> "Rating":
+        r = (raw or "s").lower()
+        return _RATING_MAP.get(r, cls.SAFE)
+
+
+_RATING_MAP = {
+    "safe": Rating.SAFE, "s": Rating.SAFE, "general": Rating.SAFE, "sensitive": Rating.SAFE,
+    "questionable": Rating.QUESTIONABLE, "q": Rating.QUESTIONABLE,
+    "explicit": Rating.EXPLICIT, "e": Rating.EXPLICIT,
+}
+
+
+def intern_tags(tags: Iterable[str]) -> frozenset[str]:
+    # одни и те же теги встречаются в тысячах постов — храним по одной строке на тег
+    return frozenset(sys.intern(t.lower()) for t in tags if t)
+
+
+class Post:
+    """Компактный пост: только поля, которые реально используются ботом."""
+
+    __slots__ = (
+        "id", "file_url", "file_ext", "rating", "tags", "created_at", "score", "rank",
+        "sample_url", "preview_url", "width", "height",
+    )
+
+    def __init__(
+        self, id: int, file_url: str, file_ext: str, rating: Rating, tags: frozenset[str],
+        created_at: str | None, score: int = 0,
+        sample_url: str = "", preview_url: str = "", width: int = 0, height: int = 0,
+    ):
+        self.id = id
+        self.file_url = file_url
+        self.file_ext = file_ext
+        self.sample_url = sample_url      # уменьшенная копия (пусто, если её нет или она совпадает с оригиналом)
+        self.preview_url = preview_url
+        self.width = width                # размеры оригинала по данным API (0 — неизвестны)
+        self.height = height
+        self.rating = rating
+        self.tags = tags
+        self.created_at = created_at
+        self.score = score
+        self.rank = 0.0     # оценка для топа периода (больше — лучше), ставит services/ranking
+
+    def nbytes(self) -> int:
+        """Примерный объём в памяти. Строки тегов общие (intern) — считаем только само множество."""
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.file_url)
+            + (sys.getsizeof(self.sample_url) if self.sample_url else 0)
+            + (sys.getsizeof(self.preview_url) if self.preview_url else 0)
+            + sys.getsizeof(self.tags)
+            + (sys.getsizeof(self.created_at) if self.created_at else 0)
+        )
+
+    def as_dict(self) -> dict:
+        """Сериализация в вид выдачи API — обратно читается parsers.parse.normalize_post."""
+        return {
+            "id": self.id,
+            "file_url": self.file_url,
+            "file_ext": self.file_ext,
+            "rating": self.rating.value,
+            "tags": " ".join(self.tags),
+            "created_at": self.created_at,
+            "score": self.score,
+            "sample_url": self.sample_url,
+            "preview_url": self.preview_url,
+            "width": self.width,
+            "height": self.height,
+        }
+
+    @property
+    def page_url(self) -> str:
+        return f"https://gelbooru.com/index.php?page=post&s=view&id={self.id}"
+
+    def __repr__(self) -> str:
+        return f"Post(id={self.id}, ext={self.file_ext}, rating={self.rating.value})"
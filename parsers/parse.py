@@ -0,0 +1,181 @@
+# parsers/parse.py
+import json
+import logging
+import sys
+from typing import Any, AsyncIterator, Dict, Iterable, List
+from xml.parsers import expat
+
+from parsers.models import Post, Rating, intern_tags
+
+try:  # быстрый JSON, если установлен
+    import orjson
+
+    def json_loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover - зависит от окружения
+    def json_loads(data: bytes) -> Any:
+        return json.loads(data)
+
+    JSON_BACKEND = "json"
+
+# только эти поля поста нам нужны, остальное не материализуем
+FIELDS = frozenset({
+    "id", "file_url", "sample_url", "preview_url", "width", "height", "file_ext", "rating", "tags", "created_at", "score",
+})
+
+
+def _norm_ext(url: str, fallback: str = "") -> str:
+    try:
+        ext = url.rsplit(".", 1)[-1].lower()
+        if "/" in ext or "?" in ext:
+            return fallback
+        return ext
+    except Exception:
+        return fallback
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def normalize_post(p: Dict[str, Any]) -> Post | None:
+    file_url = p.get("file_url") or p.get("sample_url") or ""
+    if not file_url:
+        return None
+    ext = (p.get("file_ext") or _norm_ext(file_url) or "").lower()
+
+    tags_val = p.get("tags") or []
+    if isinstance(tags_val, str):
+        # один lower() на всю строку и intern через map — самый горячий участок разбора
+        tags = frozenset(map(sys.intern, tags_val.lower().split()))
+    elif isinstance(tags_val, list):
+        tags = intern_tags(str(t) for t in tags_val)
+    else:
+        tags = frozenset()
+
+    try:
+        post_id = int(p.get("id"))
+    except (TypeError, ValueError):
+        return None
+    sample_url = p.get("sample_url") or ""
+    if sample_url == file_url:
+        sample_url = ""
+
+    return Post(
+        id=post_id,
+        file_url=file_url,
+        file_ext=ext,
+        rating=Rating.parse(p.get("rating")),
+        tags=tags,
+        created_at=p.get("created_at"),
+        score=_int(p.get("score")),
+        sample_url=sample_url,
+        preview_url=p.get("preview_url") or "",
+        width=_int(p.get("width")),
+        height=_int(p.get("height")),
+    )
+
+
+class XmlPostParser:
+    """
+    Инкрементальный разбор XML-выдачи на expat: байты подаются кусками прямо из сокета,
+    дерево не строится, каждый <post> сразу превращается в Post.
+    Понимает и атрибутный формат (<post id=".." .../>), и формат с дочерними тегами.
+    """
+
+    def __init__(self):
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._chars
+        self._fields: Dict[str, str] | None = None   # пост в формате с дочерними тегами
+        self._field: str | None = None
+        self._text: List[str] = []
+        self.posts: List[Post] = []
+
+    def _add(self, fields: Dict[str, Any]) -> None:
+        post = normalize_post(fields)
+        if post is not None:
+            self.posts.append(post)
+
+    def _start(self, name: str, attrs: Dict[str, str]) -> None:
+        if name == "post":
+            if attrs:
+                self._add(attrs)
+            else:
+                self._fields = {}
+        elif self._fields is not None and name in FIELDS:
+            self._field = name
+            self._text = []
+
+    def _chars(self, data: str) -> None:
+        if self._field is not None:
+            self._text.append(data)
+
+    def _end(self, name: str) -> None:
+        if self._field is not None and name == self._field:
+            self._fields[name] = "".join(self._text)
+            self._field = None
+        elif name == "post" and self._fields is not None:
+            self._add(self._fields)
+            self._fields = None
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.Parse(chunk, False)
+
+    def close(self) -> List[Post]:
+        self._parser.Parse(b"", True)
+        return self.posts
+
+
+def parse_xml_bytes(data: bytes) -> List[Post]:
+    parser = XmlPostParser()
+    try:
+        parser.feed(data)
+        return parser.close()
+    except expat.ExpatError as e:
+        logging.exception("Gelbooru XML parse error: %s", e)
+        return []
+
+
+async def parse_xml_stream(chunks: AsyncIterator[bytes]) -> List[Post]:
+    parser = XmlPostParser()
+    try:
+        async for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+    except expat.ExpatError as e:
+        logging.exception("Gelbooru XML parse error: %s", e)
+        return []
+
+
+def _json_posts(data: Any) -> Iterable[Dict[str, Any]]:
+    if isinstance(data, dict):
+        posts = data.get("post") or data.get("posts") or []
+        if isinstance(posts, dict):
+            posts = posts.get("post") or []
+    else:
+        posts = data
+    return (p for p in (posts or []) if isinstance(p, dict))
+
+
+def parse_json_bytes(data: bytes) -> List[Post]:
+    if not data.strip():
+        return []
+    try:
+        decoded = json_loads(data)
+    except ValueError as e:
+        logging.exception("Gelbooru JSON parse error: %s", e)
+        return []
+    posts: List[Post] = []
+    for p in _json_posts(decoded):
+        post = normalize_post(p)
+        if post is not None:
+            posts.append(post)
+    return posts
@@ -1,14 +1,127 @@
 #scheduler.py
 
-import datetime
 import asyncio
-from services.images import send_image_toeveryone
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List
+
+from config import CACHE_TTL, SCHEDULE_BROADCAST, PREWARM_LEAD_MIN, SCHEDULE_CATCHUP_HOURS, SCHEDULER_TICK_SEC
+from database.schedule import get_job, claim_run, renew_lease, finish_run
+from services.cron import Cron
+from services.images import send_image_toeveryone, prewarm_broadcast
+
+LEASE_SEC = 120     # столько слот считается занятым без продления; упавший процесс отдаёт его другому
+
+
+class Job:
+    """
+    Задание по cron-расписанию (shift сдвигает каждый слот, например «за 15 минут до»).
+    run получает время слота — по нему задание отличает один запуск от другого.
+    Пропущенный из-за простоя слот выполняется при старте, если ему не больше catchup;
+    из нескольких пропущенных — только последний.
+    """
+
+    def __init__(self, name: str, cron: Cron, run: Callable[[datetime], Awaitable[None]],
+                 shift: timedelta = timedelta(0), catchup: timedelta = timedelta(hours=24)):
+        self.name = name
+        self.cron = cron
+        self.run = run
+        self.shift = shift
+        self.catchup = catchup
+
+    def next_after(self, dt: datetime) -> datetime:
+        return self.cron.next_after(dt - self.shift) + self.shift
+
+    def due_slot(self, last: datetime | None, now: datetime) -> datetime | None:
+        """Последний наступивший слот после last, не старше catchup."""
+        t = now - self.catchup if last is None else max(last, now - self.catchup)
+        slot = None
+        while (nxt := self.next_after(t)) <= now:
+            slot = t = nxt
+        return slot
+
+
+def _local(dt: datetime) -> datetime:
+    # в БД timestamptz, расписание — в локальном времени без пояса
+    return dt.astimezone().replace(tzinfo=None)
+
+
+async def _run(job: Job, slot: datetime, stored_slot: datetime) -> None:
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(LEASE_SEC / 3)
+            try:
+                await renew_lease(job.name, stored_slot, LEASE_SEC)
+            except Exception as e:
+                logging.warning("scheduler: lease renewal for %s failed: %s", job.name, e)
+
+    logging.info("scheduler: running %s (slot %s)", job.name, slot)
+    lease = asyncio.create_task(keep_lease())
+    error = None
+    try:
+        await job.run(slot)
+    except Exception as e:
+        # слот всё равно закрываем: повтор по расписанию, а не бесконечный перезапуск
+        logging.exception("scheduler: job %s failed: %s", job.name, e)
+        error = str(e)[:1000] or type(e).__name__
+    finally:
+        lease.cancel()
+    await finish_run(job.name, stored_slot, error)
+    logging.info("scheduler: %s finished%s", job.name, f" with error: {error}" if error else "")
+
+
+async def _tick(jobs: List[Job]) -> None:
+    now = datetime.now()
+    due = []
+    for job in jobs:
+        row = await get_job(job.name)
+        last = _local(row["slot"]) if row is not None else None
+        if row is not None and row["finished_at"] is None and row["lease_expired"]:
+            # процесс, взявший слот, упал посреди задания — доделываем (рассылка продолжит с курсора)
+            due.append((last, job, row["slot"]))
+            continue
+        slot = job.due_slot(last, now)
+        if slot is not None:
+            due.append((slot, job, slot.astimezone()))
+    # по времени слота: прогрев раньше рассылки, даже если оба пропущены
+    for slot, job, stored_slot in sorted(due, key=lambda d: d[0]):
+        if await claim_run(job.name, stored_slot, LEASE_SEC):
+            await _run(job, slot, stored_slot)
+
+
+def _prewarm_lead() -> timedelta:
+    lead = timedelta(minutes=PREWARM_LEAD_MIN)
+    if lead.total_seconds() >= CACHE_TTL:
+        # прогретые буферы и пулы протухли бы ровно к рассылке
+        logging.warning(
+            "scheduler: PREWARM_LEAD_MIN=%d is not less than CACHE_TTL=%ds, prewarming %ds before instead",
+            PREWARM_LEAD_MIN, CACHE_TTL, CACHE_TTL // 2
+        )
+        lead = timedelta(seconds=CACHE_TTL // 2)
+    return lead
+
+
+def _jobs(bot) -> List[Job]:
+    broadcast = Cron(SCHEDULE_BROADCAST)
+    catchup = timedelta(hours=SCHEDULE_CATCHUP_HOURS)
+    lead = _prewarm_lead()
+    return [
+        Job("prewarm:week", broadcast, lambda slot: prewarm_broadcast(period="week", fresh_for=lead.total_seconds()),
+            shift=-lead, catchup=catchup),
+        Job("broadcast:week", broadcast, lambda slot: send_image_toeveryone(bot, period="week", slot=slot),
+            catchup=catchup),
+    ]
+
 
 async def scheduler(bot):
+    """
+    Планировщик с состоянием в БД (scheduler_jobs): расписание не зависит от времени запуска
+    процесса, каждый слот выполняется ровно одним экземпляром, пропущенные слоты догоняются.
+    """
+    jobs = _jobs(bot)
     while True:
-        now = datetime.datetime.now()
-        if now.weekday() == 1:
-            await send_image_toeveryone(bot, period="week")
-            await asyncio.sleep(24 * 3600)
-        else:
-            await asyncio.sleep(24 * 3600)
\ No newline at end of file
+        try:
+            await _tick(jobs)
+        except Exception as e:
+            logging.warning("scheduler tick failed: %s", e)
+        await asyncio.sleep(SCHEDULER_TICK_SEC)
@@ -0,0 +1,219 @@
+# services/broadcast.py
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Set
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from config import BROADCAST_WORKERS, BROADCAST_RATE, BROADCAST_BURST
+from database.users import unsubscribe_users
+from database.broadcasts import get_progress, start_progress, save_progress, finish_progress
+from services.metrics import registry
+
+PROGRESS_EVERY_SEC = 5.0
+MAX_ATTEMPTS = 3
+
+BROADCAST_USERS = registry.gauge("bot_broadcast_users", "Прогресс текущей/последней рассылки", ("broadcast", "state"))
+BROADCAST_RETRY_AFTER = registry.counter("bot_broadcast_retry_after_total", "RetryAfter от Telegram во время рассылок")
+
+# текущая рассылка процесса (последняя остаётся до следующей, чтобы был виден итог)
+_current: "Broadcast | None" = None
+
+
+class TokenBucket:
+    """Глобальный token bucket под лимиты Telegram на массовую отправку (~30 сообщений/сек)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float) -> None:
+        # RetryAfter от Telegram останавливает всех воркеров, а не только получившего его
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class Broadcast:
+    """
+    Рассылка с ограниченным пулом воркеров. Пользователи обрабатываются по возрастанию id,
+    курсор — наибольший id, до которого включительно всё уже обработано; он сохраняется в БД,
+    так что прерванная рассылка продолжается с места остановки.
+    Получатели читаются из БД пачками по мере отправки (в памяти — не больше пары пачек),
+    заблокировавшие бота отписываются пачкой вместе с сохранением прогресса.
+    """
+
+    def __init__(
+        self,
+        broadcast_id: str,
+        send_one: Callable[[int], Awaitable[None]],
+        workers: int = BROADCAST_WORKERS,
+        bucket: TokenBucket | None = None,
+        on_done: Callable[[int], None] | None = None,
+    ):
+        self.broadcast_id = broadcast_id
+        self.send_one = send_one
+        self.on_done = on_done      # пользователь обработан (после всех попыток)
+        self.workers = max(1, workers)
+        self.bucket = bucket or TokenBucket(BROADCAST_RATE, BROADCAST_BURST)
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.cursor = 0
+        self._pending: Deque[int] = deque()
+        self._done: Set[int] = set()
+        self._unsubscribe: List[int] = []
+        self._processed = 0
+        self._total = 0
+        self._started_at = 0.0
+
+    async def _deliver(self, user_id: int) -> None:
+        for _ in range(MAX_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await self.send_one(user_id)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                logging.warning(f"Broadcast {self.broadcast_id}: RetryAfter {e.retry_after}s (user {user_id})")
+                BROADCAST_RETRY_AFTER.inc()
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                self.blocked += 1
+                self._unsubscribe.append(user_id)
+                return
+            except Exception as e:
+                logging.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+                self.failed += 1
+                return
+        self.failed += 1
+
+    def _complete(self, user_id: int) -> None:
+        if self.on_done is not None:
+            self.on_done(user_id)
+        self._processed += 1
+        self._done.add(user_id)
+        while self._pending and self._pending[0] in self._done:
+            self.cursor = self._pending.popleft()
+            self._done.discard(self.cursor)
+
+    async def _worker(self, queue: "asyncio.Queue[int | None]") -> None:
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            try:
+                await self._deliver(user_id)
+            finally:
+                self._complete(user_id)
+
+    async def _save(self) -> None:
+        if self._unsubscribe:
+            batch, self._unsubscribe = self._unsubscribe, []
+            try:
+                await unsubscribe_users(batch)
+            except Exception as e:
+                logging.warning(f"Broadcast {self.broadcast_id}: не удалось отписать {len(batch)} пользователей: {e}")
+                self._unsubscribe.extend(batch)
+        try:
+            await save_progress(self.broadcast_id, self.cursor, self.sent, self.failed, self.blocked)
+        except Exception as e:
+            logging.warning(f"Broadcast {self.broadcast_id}: не удалось сохранить прогресс: {e}")
+
+    def _log_progress(self) -> None:
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        rate = self._processed / elapsed
+        left = self._total - self._processed
+        eta = left / rate if rate > 0 else float("inf")
+        logging.info(
+            "broadcast %s: %d/%d (sent=%d, failed=%d, blocked=%d), %.1f users/s, ETA %.0fs",
+            self.broadcast_id, self._processed, self._total,
+            self.sent, self.failed, self.blocked, rate, eta,
+        )
+
+    async def _reporter(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY_SEC)
+            self._log_progress()
+            await self._save()
+
+    async def _produce(self, batches: AsyncIterator[List[int]], queue: "asyncio.Queue[int | None]") -> None:
+        try:
+            async for batch in batches:
+                for user_id in batch:
+                    self._pending.append(user_id)
+                    await queue.put(user_id)    # очередь ограничена: следующая пачка читается по мере отправки
+        finally:
+            for _ in range(self.workers):
+                await queue.put(None)
+
+    async def run(
+        self,
+        load_batches: Callable[[int], AsyncIterator[List[int]]],
+        count_recipients: Callable[[int], Awaitable[int]],
+    ) -> None:
+        global _current
+        row = await get_progress(self.broadcast_id)
+        if row and row["finished_at"] is not None:
+            logging.info(f"Broadcast {self.broadcast_id} уже завершена, пропускаем")
+            return
+        if row:
+            self.cursor = row["cursor"]
+            self.sent, self.failed, self.blocked = row["sent"], row["failed"], row["blocked"]
+            logging.info(f"Broadcast {self.broadcast_id}: продолжаем после пользователя {self.cursor}")
+
+        self._total = await count_recipients(self.cursor)
+        if not row:
+            await start_progress(self.broadcast_id, self._total)
+
+        self._pending = deque()
+        self._started_at = time.monotonic()
+        BROADCAST_USERS.values.clear()
+        _current = self
+
+        queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=self.workers * 4)
+        reporter = asyncio.create_task(self._reporter())
+        try:
+            await asyncio.gather(
+                self._produce(load_batches(self.cursor), queue),
+                *(self._worker(queue) for _ in range(self.workers)),
+            )
+        finally:
+            reporter.cancel()
+            await self._save()
+        self._log_progress()
+        await finish_progress(self.broadcast_id)
+
+
+@registry.collector
+def _collect_broadcast() -> None:
+    b = _current
+    if b is None:
+        return
+    for state, value in (
+        ("total", b._total), ("processed", b._processed),
+        ("sent", b.sent), ("failed", b.failed), ("blocked", b.blocked),
+    ):
+        BROADCAST_USERS.set(value, b.broadcast_id, state)
@@ -1,23 +1,62 @@
 import asyncio
+import heapq
+import itertools
+from bisect import bisect_left
 import time
 import random
 import logging
 from collections import deque, OrderedDict
 from datetime import datetime, timedelta
-from typing import Deque, Dict, List, Tuple
+from typing import Callable, Container, Deque, Dict, List, Tuple
 
 from config import (
     CACHE_REFILL_SIZE,
     CACHE_TTL,
     CACHE_MAX_KEYS,
     CACHE_MAX_PAGES,
+    CACHE_STALE_SEC,
+    CACHE_POOL_MAX_POSTS,
+    CACHE_POLL_SEC,
+    CACHE_RESCORE_SEC,
+    CACHE_MAX_MB,
+    PREFETCH_DEPTH,
+    PREFETCH_HOT_KEYS,
     GELBOORU_USER_ID,
     GELBOORU_API_KEY,
 )
 from parsers.gelbooru import fetch_by_tags
-from services.filters import is_post_allowed
+from parsers.models import Post
+from parsers.parse import normalize_post
+from services.coord import coord
+from services.filters import compile_filters
+from services.ratelimit import LANE_INTERACTIVE, LANE_REFILL
+from services.metrics import Histogram, registry
+from services.ranking import TopK, get_scorer, rank_post
 
 HARD_BAN_TAGS = {"gore", "feces", "urine", "loli", "shota"}
+HEAT_HALF_LIFE_SEC = 300     # за столько «нагрев» буфера от выдач падает вдвое
+HOT_MIN_HEAT = 2.0           # горячим считается буфер хотя бы с парой недавних выдач
+HOT_RECOMPUTE_SEC = 5
+SEEN_SCAN = 32               # сколько ближайших постов буфера перебрать в поисках невиденного
+
+CACHE_REQUESTS = registry.counter(
+    "bot_cache_requests_total", "Выдачи поста из кэша: hit, stale (SWR) или miss", ("period", "result")
+)
+CACHE_GET_SECONDS = registry.histogram("bot_cache_get_seconds", "Время get_post, включая ожидание refill", ("period",))
+CACHE_REFILL_SECONDS = registry.histogram("bot_cache_refill_seconds", "Длительность пополнения буфера", ("period",))
+CACHE_REFILL_PAGES = registry.histogram(
+    "bot_cache_refill_pages", "Сколько страниц пула потребовало одно пополнение", ("period",), buckets=(0, 1, 2, 3, 5, 10)
+)
+CACHE_POOL_PAGES = registry.counter("bot_cache_pool_pages_total", "Страницы API, загруженные общими пулами", ("period",))
+CACHE_PEER_PAGES = registry.counter(
+    "bot_cache_peer_pages_total", "Страницы пулов, взятые из общего журнала других экземпляров", ("period",)
+)
+CACHE_SEEN = registry.counter(
+    "bot_cache_seen_total", "Выдачи с учётом «уже видел»: fresh, skipped (сразу за виденными), repeat", ("result",)
+)
+CACHE_EVICTIONS = registry.counter("bot_cache_evictions_total", "Вытеснения буферов по причине", ("reason",))
+CACHE_BUFFERS = registry.gauge("bot_cache_buffers", "Буферы в кэше")
+CACHE_BYTES = registry.gauge("bot_cache_bytes", "Примерный объём постов в памяти", ("kind",))
 
 def _period_threshold(period: str) -> datetime:
     now = datetime.now()
@@ -75,132 +114,890 @@ def build_query_tags(user_filters: List[str], random_order: bool, period: str |
     tags.append("sort:random" if random_order else "sort:score")
     return tags
 
-class Buffer:
-    def __init__(self, refill_size: int, ttl_sec: int):
+def split_query_tags(user_filters: List[str]) -> tuple[Tuple[str, ...], frozenset[str]]:
+    """
+    Делит запрос на часть для общего пула (жёсткие баны, рейтинг, обязательные теги)
+    и исключения вида -tag, которые дешевле проверить локально.
+    """
+    hard = {f"-{t}" for t in HARD_BAN_TAGS}
+    pool_tags: List[str] = []
+    local_excludes: set[str] = set()
+    for t in build_query_tags(user_filters, random_order=True):
+        if t.startswith("sort:"):
+            continue
+        if t.startswith("-") and t not in hard and not t.startswith("-rating:"):
+            local_excludes.add(t[1:])
+        else:
+            pool_tags.append(t)
+    return tuple(sorted(pool_tags)), frozenset(local_excludes)
+
+
+class _Metered:
+    """Объём в байтах; изменения сразу сообщаются в общий счётчик кэша (Cache.total_bytes)."""
+
+    nbytes = 0
+    meter: Callable[[int], None] | None = None
+
+    def _account(self, delta: int) -> None:
+        self.nbytes += delta
+        if self.meter is not None:
+            self.meter(delta)
+
+
+class _SharedLog(_Metered):
+    """
+    Журнал загруженных страниц пула, общий для экземпляров бота (services/coord).
+    Перед походом в API пул дочитывает чужие страницы; свою загрузку публикует.
+    С локальным бэкендом журнал пуст и всё работает как раньше.
+    """
+
+    key: Tuple[str, Tuple[str, ...]]
+    log_seq = 0                     # последняя прочитанная из журнала запись
+    log_max_age: float | None = None
+
+    @property
+    def log_key(self) -> str:
+        return f"{self.key[0]}|{' '.join(self.key[1])}"
+
+    async def _read_log(self) -> List[Tuple[Dict[str, object], List[Post]]]:
+        pages = await coord.read_pages(self.log_key, self.log_seq, self.log_max_age)
+        out = []
+        for seq, meta, raw in pages:
+            self.log_seq = max(self.log_seq, seq)
+            out.append((meta, [p for p in map(normalize_post, raw) if p is not None]))
+            CACHE_PEER_PAGES.inc(self.key[0])
+        return out
+
+    async def _publish(self, meta: Dict[str, object], posts: List[Post]) -> None:
+        if not coord.shared:
+            return
+        seq = await coord.publish_page(self.log_key, meta, [p.as_dict() for p in posts])
+        # под pool_lock никто другой в этот журнал не пишет — можно сразу сдвинуть позицию
+        self.log_seq = max(self.log_seq, seq)
+
+
+class PostPool(_SharedLog):
+    """
+    Общий пул случайных постов одного широкого запроса (теги пула).
+    Буферы конкретных наборов фильтров — лишь «окна» в пул: каждый читает его со своей позиции
+    и фильтрует локально, поэтому одна страница API обслуживает сразу много наборов фильтров.
+    """
+
+    random_order = True
+    exhausted = False
+
+    def __init__(self, tags: Tuple[str, ...], page_size: int, max_posts: int, ttl_sec: int):
+        self.tags = tags
+        self.key = ("random", tags)
+        self.page_size = page_size
+        self.max_posts = max_posts
+        self.ttl_sec = ttl_sec
+        self.posts: Deque[Post] = deque()
+        self.base_seq = 0          # порядковый номер posts[0]
+        self.expires_at = time.time() + ttl_sec
+        self.pages_fetched = 0
+        self.log_max_age = ttl_sec
+        self._grow_task: asyncio.Task | None = None
+
+    @property
+    def end_seq(self) -> int:
+        return self.base_seq + len(self.posts)
+
+    def busy(self) -> bool:
+        return self._grow_task is not None and not self._grow_task.done()
+
+    def _reset_if_expired(self) -> None:
+        if time.time() <= self.expires_at:
+            return
+        self.base_seq = self.end_seq
+        self.posts.clear()
+        self._account(-self.nbytes)
+        self.expires_at = time.time() + self.ttl_sec
+
+    def read(self, from_seq: int) -> tuple[List[Post], int]:
+        """Посты начиная с from_seq и новая позиция читателя."""
+        self._reset_if_expired()
+        start = max(from_seq, self.base_seq) - self.base_seq
+        return list(itertools.islice(self.posts, start, None)), self.end_seq
+
+    def _extend(self, posts: List[Post]) -> None:
+        self.posts.extend(posts)
+        delta = sum(p.nbytes() for p in posts)
+        while len(self.posts) > self.max_posts:
+            delta -= self.posts.popleft().nbytes()
+            self.base_seq += 1
+        self._account(delta)
+
+    async def _grow(self, lane: int) -> int:
+        async with coord.pool_lock(self.log_key):
+            shared = await self._read_log()
+            if shared:
+                got = 0
+                for _, posts in shared:
+                    self._extend(posts)
+                    got += len(posts)
+                logging.info("pool (shared): got=%d, pool=%d, key=%s", got, len(self.posts), self.log_key)
+                return got
+            tags = list(self.tags) + ["sort:random"]
+            raw = await fetch_by_tags(tags, limit=self.page_size, lane=lane)
+            self.pages_fetched += 1
+            CACHE_POOL_PAGES.inc("random")
+            self._extend(raw)
+            await self._publish({}, raw)
+        logging.info("pool fetch: got=%d, pool=%d, tags=%s", len(raw), len(self.posts), " ".join(tags))
+        return len(raw)
+
+    async def grow(self, lane: int) -> int:
+        """Подтягивает ещё одну страницу; параллельные вызовы ждут одну и ту же загрузку."""
+        self._reset_if_expired()
+        if self._grow_task is None or self._grow_task.done():
+            self._grow_task = asyncio.create_task(self._grow(lane))
+        return await asyncio.shield(self._grow_task)
+
+
+class PeriodIngester(_SharedLog):
+    """
+    Инкрементальная загрузка «топа за период» для одного запроса.
+    Первый раз — постранично с серверным фильтром по дате (sort:score в окне периода),
+    дальше — только посты новее максимального виденного id (id:>N), не чаще раза в CACHE_POLL_SEC.
+    Такие посты приходят почти с нулевым score, поэтому раз в rescore_sec окно перечитывается
+    по sort:score и оценки уже загруженных постов пересчитываются (иначе топ застыл бы на score
+    в момент загрузки). Окно скользящее: посты старше периода вычищаются.
+    Размер окна ограничен топом TopK: при переполнении вытесняется пост с худшей оценкой.
+    """
+
+    random_order = False
+
+    def __init__(
+        self, tags: Tuple[str, ...], period: str, page_size: int, max_posts: int, poll_sec: int, rescore_sec: int
+    ):
+        self.tags = tags
+        self.period = period
+        self.key = (period, tags)
+        self.page_size = page_size
+        self.max_posts = max_posts
+        self.poll_sec = poll_sec
+        self.rescore_sec = rescore_sec
+        self.entries: List[Tuple[int, Post, datetime | None]] = []   # (seq, пост, дата создания)
+        self._ids: Dict[int, int] = {}                                # живые посты окна -> их объём
+        self.top = TopK(max_posts)
+        self.scorer = get_scorer()
+        self.next_seq = 0
+        self.max_id = 0
+        self.variant = 0            # индекс синтаксиса date: из _date_tag_variants (последний — без фильтра)
+        self.next_pid = 0
+        self.initialized = False
+        self.last_poll = 0.0
+        self.last_rescore = 0.0
+        self._expired_at = 0.0
+        self.pages_fetched = 0
+        self._grow_task: asyncio.Task | None = None
+
+    def rescore_due(self) -> bool:
+        return time.time() - self.last_rescore >= self.rescore_sec
+
+    @property
+    def exhausted(self) -> bool:
+        # всё, что есть в окне, загружено, а опрашивать новые посты и обновлять score ещё рано
+        return self.initialized and time.time() - self.last_poll < self.poll_sec and not self.rescore_due()
+
+    def _expire(self) -> None:
+        now = time.time()
+        if now - self._expired_at < 60:
+            return
+        self._expired_at = now
+        thr = _period_threshold(self.period)
+        for e in self.entries:
+            if e[2] is not None and e[2] < thr and e[1].id in self._ids:
+                self._drop(e[1].id)
+                self.top.discard(e[1].id)
+        self._compact()
+
+    def busy(self) -> bool:
+        return self._grow_task is not None and not self._grow_task.done()
+
+    def _keep(self, post: Post) -> None:
+        size = post.nbytes()
+        self._account(size - self._ids.get(post.id, 0))
+        self._ids[post.id] = size
+
+    def _drop(self, post_id: int) -> None:
+        self._account(-self._ids.pop(post_id, 0))
+
+    def _compact(self) -> None:
+        # вытесненные из топа и устаревшие записи выкидываем пачкой, когда их накопилось много
+        if len(self.entries) > 2 * len(self._ids) + 64:
+            self.entries = [e for e in self.entries if e[1].id in self._ids]
+
+    def read(self, from_seq: int) -> tuple[List[Post], int]:
+        self._expire()
+        i = bisect_left(self.entries, from_seq, key=lambda e: e[0])
+        return [e[1] for e in self.entries[i:] if e[1].id in self._ids], self.next_seq
+
+    def _add(self, posts: List[Post]) -> int:
+        now = datetime.now()
+        thr = _period_threshold(self.period)
+        added = 0
+        for p in posts:
+            self.max_id = max(self.max_id, p.id)
+            if p.id in self._ids:
+                continue
+            dt = _parse_created_at(p.created_at)
+            # если дата распарсилась и старше порога — пропускаем; если даты нет — оставляем
+            if dt is not None and dt < thr:
+                continue
+            rank_post(p, dt, self.scorer, now)
+            evicted = self.top.add(p.id, p.rank)
+            if evicted == p.id:
+                continue    # хуже всего, что уже есть в топе
+            if evicted is not None:
+                self._drop(evicted)
+            self.entries.append((self.next_seq, p, dt))
+            self._keep(p)
+            self.next_seq += 1
+            added += 1
+        self._compact()
+        return added
+
+    def _refresh(self, posts: List[Post]) -> int:
+        """
+        Свежие score из повторного чтения окна: заменяет посты окна пришедшими копиями и
+        пересчитывает оценки всего окна (у velocity меняется и возраст). seq не меняется —
+        буферы увидят новые оценки, когда соберутся заново; новые посты добавляются как обычно.
+        """
+        now = datetime.now()
+        fresh = {p.id: p for p in posts}
+        entries = []
+        for seq, post, dt in self.entries:
+            if post.id not in self._ids:
+                continue
+            post = fresh.pop(post.id, post)
+            self._keep(post)
+            rank_post(post, dt, self.scorer, now)
+            self.top.update(post.id, post.rank)
+            entries.append((seq, post, dt))
+        self.entries = entries
+        return self._add(list(fresh.values()))
+
+    def _window_tags(self) -> List[str]:
+        date_tags = (_date_tag_variants(self.period) + [[]])[self.variant]
+        # без серверного фильтра по дате остаётся только листать свежие посты
+        return list(self.tags) + date_tags + ["sort:score" if date_tags else "sort:date"]
+
+    async def _initial_page(self, lane: int) -> int:
+        variants = _date_tag_variants(self.period) + [[]]
+        while True:
+            date_tags = variants[self.variant]
+            # без серверного фильтра по дате остаётся только листать свежие посты
+            tags = list(self.tags) + date_tags + ["sort:score" if date_tags else "sort:date"]
+            raw = await fetch_by_tags(tags, limit=self.page_size, pid=self.next_pid, lane=lane)
+            self.pages_fetched += 1
+            CACHE_POOL_PAGES.inc(self.period)
+            if not raw and self.next_pid == 0 and self.variant < len(variants) - 1:
+                # этот синтаксис date: сервер не понял — пробуем следующий
+                self.variant += 1
+                continue
+            self.next_pid += 1
+            added = self._add(raw)
+            if len(raw) < self.page_size or self.next_pid >= max(1, CACHE_MAX_PAGES) or (not date_tags and added < len(raw)):
+                self.initialized = True
+                self.last_poll = self.last_rescore = time.time()
+            await self._publish(
+                {"phase": "initial", "pid": self.next_pid - 1, "variant": self.variant,
+                 "final": self.initialized, "at": time.time()},
+                raw,
+            )
+            logging.info(
+                "ingest (initial): got=%d, added=%d, window=%d, period=%s, tags=%s",
+                len(raw), added, len(self.entries), self.period, " ".join(tags)
+            )
+            return added
+
+    async def _poll(self, lane: int) -> int:
+        added = 0
+        for _ in range(max(1, CACHE_MAX_PAGES)):
+            tags = list(self.tags) + [f"id:>{self.max_id}", "sort:id:asc"]
+            raw = await fetch_by_tags(tags, limit=self.page_size, lane=lane)
+            self.pages_fetched += 1
+            CACHE_POOL_PAGES.inc(self.period)
+            added += self._add(raw)
+            await self._publish({"phase": "poll", "at": time.time()}, raw)
+            if len(raw) < self.page_size:
+                break
+        self.last_poll = time.time()
+        logging.info(
+            "ingest (poll): added=%d, window=%d, max_id=%d, period=%s, tags=%s",
+            added, len(self.entries), self.max_id, self.period, " ".join(self.tags)
+        )
+        return added
+
+    async def _rescore(self, lane: int) -> int:
+        # те же страницы окна, что и при первой загрузке: лучшие посты периода с текущим score
+        tags = self._window_tags()
+        refreshed = added = 0
+        for pid in range(max(1, CACHE_MAX_PAGES)):
+            raw = await fetch_by_tags(tags, limit=self.page_size, pid=pid, lane=lane)
+            self.pages_fetched += 1
+            CACHE_POOL_PAGES.inc(self.period)
+            refreshed += len(raw)
+            added += self._refresh(raw)
+            await self._publish({"phase": "rescore", "at": time.time()}, raw)
+            if len(raw) < self.page_size:
+                break
+        self.last_rescore = time.time()
+        logging.info(
+            "ingest (rescore): refreshed=%d, added=%d, window=%d, period=%s, tags=%s",
+            refreshed, added, len(self.entries), self.period, " ".join(tags)
+        )
+        return added
+
+    def _apply_shared(self, meta: Dict[str, object], posts: List[Post]) -> int:
+        # чужая страница двигает и состояние загрузки, чтобы не повторять её запросы
+        at = float(meta.get("at") or 0.0)
+        phase = meta.get("phase")
+        if phase == "rescore":
+            self.last_rescore = max(self.last_rescore, at)
+            return self._refresh(posts)
+        added = self._add(posts)
+        if phase == "initial":
+            if not self.initialized:
+                self.variant = int(meta.get("variant") or 0)
+                self.next_pid = max(self.next_pid, int(meta.get("pid") or 0) + 1)
+                if meta.get("final"):
+                    self.initialized = True
+                    self.last_poll = max(self.last_poll, at)
+                    self.last_rescore = max(self.last_rescore, at)
+        else:
+            self.last_poll = max(self.last_poll, at)
+        return added
+
+    async def _grow(self, lane: int) -> int:
+        async with coord.pool_lock(self.log_key):
+            shared = await self._read_log()
+            if shared:
+                added = sum(self._apply_shared(meta, posts) for meta, posts in shared)
+                logging.info(
+                    "ingest (shared): pages=%d, added=%d, window=%d, key=%s",
+                    len(shared), added, len(self.entries), self.log_key
+                )
+                return added
+            if self.exhausted:
+                return 0
+            if not self.initialized:
+                return await self._initial_page(lane)
+            if self.rescore_due():
+                return await self._rescore(lane)
+            return await self._poll(lane)
+
+    async def grow(self, lane: int) -> int:
+        if self.exhausted:
+            return 0
+        if self._grow_task is None or self._grow_task.done():
+            self._grow_task = asyncio.create_task(self._grow(lane))
+        return await asyncio.shield(self._grow_task)
+
+
+class Buffer(_Metered):
+    def __init__(self, refill_size: int, ttl_sec: int, stale_sec: int = 0):
         self.refill_size = refill_size
         self.ttl_sec = ttl_sec
-        self.items: Deque[dict] = deque()
+        self.stale_sec = stale_sec
+        self.items: Deque[Post] = deque()
         self.expires_at: float = 0.0
         self.lock = asyncio.Lock()
+        self.refill_task: asyncio.Task | None = None
+        self.cursors: Dict[Tuple[str, Tuple[str, ...]], int] = {}  # позиция чтения в каждом пуле
+        self.heat = 0.0              # экспоненциально затухающее число выдач
+        self.heat_at = 0.0
+
+    def heat_now(self, now: float) -> float:
+        return self.heat * 0.5 ** ((now - self.heat_at) / HEAT_HALF_LIFE_SEC)
+
+    def touch(self, now: float) -> None:
+        self.heat = self.heat_now(now) + 1.0
+        self.heat_at = now
+
+    def busy(self) -> bool:
+        # кто-то ждёт под lock или идёт пополнение — такой буфер не вытесняем
+        return self.lock.locked() or (self.refill_task is not None and not self.refill_task.done())
 
     def expired(self) -> bool:
         return time.time() > self.expires_at
 
-    def put_all(self, posts: List[dict]) -> None:
-        random.shuffle(posts)
-        self.items = deque(posts)
+    def hard_stale(self) -> bool:
+        # дольше этого после истечения TTL старые посты не отдаём — только синхронный refill
+        return time.time() > self.expires_at + self.stale_sec
+
+    def merge(self, posts: List[Post], replace: bool = False) -> int:
+        """
+        Добавляет новые посты в буфер (без дублей) и возвращает, сколько реально добавлено.
+        replace — протухший буфер: старые посты выбрасываются.
+        """
+        if replace:
+            self.items.clear()
+            self._account(-self.nbytes)
+        seen = {p.id for p in self.items}
+        fresh: List[Post] = []
+        for p in posts:
+            if p.id not in seen:
+                seen.add(p.id)
+                fresh.append(p)
+        random.shuffle(fresh)
+        # pop() берёт справа: уже лежащие посты уйдут раньше свежих
+        self.items.extendleft(fresh)
+        self._account(sum(p.nbytes() for p in fresh))
+        self.expires_at = time.time() + self.ttl_sec
+        return len(fresh)
+
+    def unserved(self, posts: List[Post]) -> List[Post]:
+        """Посты, которые буфер ещё не выдавал. Случайный буфер выданных не помнит."""
+        return posts
+
+    def restart(self, window: List[Post]) -> None:
+        """Новый проход по окну пула: выданными остаются только посты из window."""
+
+    def pop(self, seen: Container[int] | None = None) -> Post | None:
+        """
+        Следующий пост. С seen — ближайший невиденный из SEEN_SCAN следующих; пропущенные
+        остаются в буфере для других пользователей. Если все виденные — отдаём следующий как есть.
+        """
+        if not self.items:
+            return None
+        if seen is not None:
+            for i in range(1, min(SEEN_SCAN, len(self.items)) + 1):
+                if self.items[-i].id not in seen:
+                    post = self.items[-i]
+                    del self.items[-i]
+                    self._account(-post.nbytes())
+                    CACHE_SEEN.inc("skipped" if i > 1 else "fresh")
+                    return post
+            CACHE_SEEN.inc("repeat")
+        post = self.items.pop()
+        self._account(-post.nbytes())
+        return post
+
+    def posts(self) -> List[Post]:
+        return list(self.items)
+
+    def peek(self, n: int) -> List[Post]:
+        """Следующие n постов в порядке выдачи, не вынимая их."""
+        return [self.items[-i] for i in range(1, min(n, len(self.items)) + 1)]
+
+class RankedBuffer(Buffer):
+    """
+    Буфер топа: куча по оценке, pop() отдаёт лучший ещё не выданный пост за O(log n).
+    Выданные посты запоминаются: протухший буфер собирается заново из всего окна пула
+    (с новыми оценками), и уже показанное в него не возвращается до следующего прохода.
+    """
+
+    def __init__(self, refill_size: int, ttl_sec: int, stale_sec: int = 0):
+        super().__init__(refill_size, ttl_sec, stale_sec)
+        self.items: List[Tuple[float, int, Post]] = []   # (-rank, -id, пост)
+        self._ids: set[int] = set()
+        self.served: set[int] = set()                     # выданные за текущий проход по окну
+
+    def unserved(self, posts: List[Post]) -> List[Post]:
+        return [p for p in posts if p.id not in self.served]
+
+    def restart(self, window: List[Post]) -> None:
+        # ушедшие из окна посты больше не придут — незачем их помнить
+        self.served &= {p.id for p in window}
+
+    def merge(self, posts: List[Post], replace: bool = False) -> int:
+        if replace:
+            self.items.clear()
+            self._ids.clear()
+            self._account(-self.nbytes)
+        added = 0
+        for p in posts:
+            # выданные, пока шло пополнение, тоже не возвращаем
+            if p.id in self._ids or p.id in self.served:
+                continue
+            self._ids.add(p.id)
+            heapq.heappush(self.items, (-p.rank, -p.id, p))
+            self._account(p.nbytes())
+            added += 1
         self.expires_at = time.time() + self.ttl_sec
+        return added
 
-    def pop(self) -> dict | None:
-        return self.items.pop() if self.items else None
+    def pop(self, seen: Container[int] | None = None) -> Post | None:
+        if not self.items:
+            return None
+        if seen is None:
+            entry = heapq.heappop(self.items)
+        else:
+            held: List[Tuple[float, int, Post]] = []
+            entry = None
+            while self.items and len(held) < SEEN_SCAN:
+                e = heapq.heappop(self.items)
+                if e[2].id not in seen:
+                    entry = e
+                    break
+                held.append(e)
+            if entry is None:
+                entry = held.pop(0)     # невиденных рядом нет — отдаём лучший, как без фильтра
+                CACHE_SEEN.inc("repeat")
+            else:
+                CACHE_SEEN.inc("skipped" if held else "fresh")
+            for e in held:
+                heapq.heappush(self.items, e)
+        post = entry[2]
+        self._ids.discard(post.id)
+        self.served.add(post.id)
+        self._account(-post.nbytes())
+        return post
+
+    def posts(self) -> List[Post]:
+        return [e[2] for e in self.items]
+
+    def peek(self, n: int) -> List[Post]:
+        return [e[2] for e in heapq.nsmallest(n, self.items)]
 
 class Cache:
-    def __init__(self, refill_size: int, ttl_sec: int, max_keys: int):
+    def __init__(
+        self, refill_size: int, ttl_sec: int, max_keys: int, stale_sec: int = 0, max_bytes: int = 0,
+        hot_keys: int = 0, prefetch_depth: int = 0,
+    ):
         self.refill_size = refill_size
         self.ttl_sec = ttl_sec
         self.max_keys = max_keys
+        self.max_bytes = max_bytes or float("inf")
         self.buffers: OrderedDict[Tuple[str, str], Buffer] = OrderedDict()
-        self._rate_lock = asyncio.Lock()
-        self._last_req_at = 0.0
+        self.pools: OrderedDict[Tuple[str, Tuple[str, ...]], PostPool | PeriodIngester] = OrderedDict()
+        self.total_bytes = 0        # буферы и пулы; ведут сами, сообщая изменения через _meter
+        self.stale_sec = stale_sec
+        self.stats = {
+            "hits": 0, "stale_hits": 0, "misses": 0,
+            "refills": 0, "refills_deduped": 0, "refills_wasted": 0,
+            "evicted_bytes": 0,
+        }
+        self.evictions = {"stale": 0, "keys": 0, "bytes": 0, "pool": 0}
+        self.latency = Histogram()
+        # хуки предзагрузки медиа (services/prefetch): следующие посты горячих буферов и выпавшие посты
+        self.on_hot: Callable[[List[Post]], None] | None = None
+        self.on_drop: Callable[[List[Post]], None] | None = None
+        self.hot_keys = hot_keys
+        self.prefetch_depth = prefetch_depth
+        self._hot: set[Tuple[str, str]] = set()
+        self._hot_at = 0.0
 
     def _key(self, period_key: str, filters_key: str) -> Tuple[str, str]:
         return (period_key, filters_key)
 
-    async def _rate_limit(self):
-        async with self._rate_lock:
-            delta = time.time() - self._last_req_at
-            if delta < 1.0:
-                await asyncio.sleep(1.0 - delta)
-            self._last_req_at = time.time()
+    @staticmethod
+    def filters_key(user_filters: List[str]) -> str:
+        # каноничный вид набора фильтров: одинаковые наборы делят один буфер
+        return ",".join(sorted(map(str.lower, user_filters)))
 
     def _get_or_create(self, key: Tuple[str, str]) -> Buffer:
         buf = self.buffers.get(key)
         if buf is None:
-            if len(self.buffers) >= self.max_keys:
-                self.buffers.popitem(last=False)
-            buf = Buffer(self.refill_size, self.ttl_sec)
+            buffer_cls = Buffer if key[0] == "random" else RankedBuffer
+            buf = buffer_cls(self.refill_size, self.ttl_sec, self.stale_sec)
+            buf.meter = self._meter
             self.buffers[key] = buf
+            self._enforce_limits(keep=key)
         self.buffers.move_to_end(key, last=True)
         return buf
 
-    async def _refill(self, buf: Buffer, user_filters: List[str], period: str, random_order: bool) -> None:
-        base = build_query_tags(user_filters, random_order=random_order)
+    def _meter(self, delta: int) -> None:
+        self.total_bytes += delta
 
-        # RANDOM: одной страницы обычно достаточно
-        if random_order:
-            await self._rate_limit()
-            raw = await fetch_by_tags(base, limit=self.refill_size)
-            filtered = [p for p in raw if is_post_allowed(p, user_filters)]
-            logging.info(
-                "cache refill: got=%d, after_filter=%d, random=%s, period=%s, tags=%s",
-                len(raw), len(filtered), random_order, period, " ".join(base)
-            )
-            buf.put_all(filtered)
-            return
+    def nbytes(self) -> int:
+        """Объём буферов и пулов — без пересчёта, счётчик ведётся при каждом изменении."""
+        return self.total_bytes
+
+    def _dropped(self, posts: List[Post]) -> None:
+        if posts and self.on_drop is not None:
+            self.on_drop(posts)
+
+    def _is_hot(self, key: Tuple[str, str], buf: Buffer, now: float) -> bool:
+        if now - self._hot_at > HOT_RECOMPUTE_SEC:
+            self._hot_at = now
+            top = heapq.nlargest(self.hot_keys, self.buffers.items(), key=lambda kv: kv[1].heat_now(now))
+            self._hot = {k for k, b in top if b.heat_now(now) >= HOT_MIN_HEAT}
+        if key not in self._hot and buf.heat >= HOT_MIN_HEAT and len(self._hot) < self.hot_keys:
+            self._hot.add(key)   # на свободное место среди горячих — не дожидаясь пересчёта
+        return key in self._hot
+
+    def _served(self, key: Tuple[str, str], buf: Buffer) -> None:
+        now = time.monotonic()
+        buf.touch(now)
+        if self.on_hot is not None and self.prefetch_depth > 0 and self._is_hot(key, buf, now):
+            self.on_hot(buf.peek(self.prefetch_depth))
+
+    def _evict(self, key: Tuple[str, str], reason: str) -> None:
+        buf = self.buffers.pop(key)
+        buf.meter = None
+        self.total_bytes -= buf.nbytes
+        self._hot.discard(key)
+        self._dropped(buf.posts())
+        self.evictions[reason] += 1
+        CACHE_EVICTIONS.inc(reason)
+        self.stats["evicted_bytes"] += buf.nbytes
+        logging.info(
+            "cache evict: reason=%s, key=%s, items=%d, bytes=%d, total_bytes=%d, keys=%d",
+            reason, key, len(buf.items), buf.nbytes, self.nbytes(), len(self.buffers)
+        )
 
-        # TOP BY PERIOD: сортировка по дате + постраничный обход без server-side date
-        # убираем старую sort:* и ставим sort:date
-        tags_top = [t for t in base if not t.startswith("sort:")]
-        tags_top.append("sort:date")
+    def _evict_lru(self, reason: str, keep: Tuple[str, str] | None) -> bool:
+        # от давно не используемых к свежим; занятые (lock/refill в полёте) пропускаем —
+        # их ждущие держат ссылку на буфер, а пополнение иначе ушло бы в «осиротевший» буфер
+        for key, buf in self.buffers.items():
+            if key != keep and not buf.busy():
+                self._evict(key, reason)
+                return True
+        return False
 
-        thr = _period_threshold(period)
-        collected: List[dict] = []
-        pid = 0
-        page_limit = max(1, CACHE_MAX_PAGES)  # возьми из config, по умолчанию 6
+    def _evict_pool(self, keep: Tuple[str, str] | None) -> bool:
+        # давно не используемый пул вместе с позициями чтения в нём; буферы, читавшие его, при следующем
+        # пополнении начнут новый пул. Пул, который сейчас грузится или читается пополнением, не трогаем
+        for pool_key, pool in self.pools.items():
+            if pool.busy():
+                continue
+            readers = [(k, b) for k, b in self.buffers.items() if pool_key in b.cursors]
+            if any(k == keep or b.busy() for k, b in readers):
+                continue
+            del self.pools[pool_key]
+            pool.meter = None
+            self.total_bytes -= pool.nbytes
+            for _, buf in readers:
+                buf.cursors.pop(pool_key, None)
+            self.evictions["pool"] += 1
+            CACHE_EVICTIONS.inc("pool")
+            self.stats["evicted_bytes"] += pool.nbytes
+            logging.info(
+                "cache evict pool: key=%s, bytes=%d, readers=%d, total_bytes=%d, pools=%d",
+                pool_key, pool.nbytes, len(readers), self.total_bytes, len(self.pools)
+            )
+            return True
+        return False
 
-        while len(collected) < self.refill_size and pid < page_limit:
-            await self._rate_limit()
-            raw = await fetch_by_tags(tags_top, limit=min(self.refill_size, 100), pid=pid)
-            if not raw:
+    def _enforce_limits(self, keep: Tuple[str, str] | None = None) -> None:
+        for key in [k for k, b in self.buffers.items() if k != keep and not b.busy() and b.hard_stale()]:
+            self._evict(key, "stale")
+        while len(self.buffers) > self.max_keys and self._evict_lru("keys", keep):
+            pass
+        # в бюджет входят и пулы: по одному на необычный набор тегов, до CACHE_POOL_MAX_POSTS постов каждый.
+        # Сначала уходят давно не используемые пулы, затем — LRU-буферы
+        while self.total_bytes > self.max_bytes:
+            if not self._evict_pool(keep) and not (len(self.buffers) > 1 and self._evict_lru("bytes", keep)):
                 break
 
-            for p in raw:
-                if not is_post_allowed(p, user_filters):
-                    continue
-                dt = _parse_created_at(p.get("created_at"))
-                # если дата распарсилась и старше порога — пропускаем; если даты нет — оставляем
-                if dt is not None and dt < thr:
-                    continue
-                collected.append(p)
-                if len(collected) >= self.refill_size:
-                    break
+    def _get_pool(self, tags: Tuple[str, ...], period: str, random_order: bool) -> PostPool | PeriodIngester:
+        key = ("random" if random_order else period, tags)
+        pool = self.pools.get(key)
+        if pool is None:
+            page_size = min(self.refill_size, 100)
+            if random_order:
+                pool = PostPool(tags, page_size=page_size, max_posts=CACHE_POOL_MAX_POSTS, ttl_sec=self.ttl_sec)
+            else:
+                pool = PeriodIngester(
+                    tags, period, page_size=page_size, max_posts=CACHE_POOL_MAX_POSTS,
+                    poll_sec=CACHE_POLL_SEC, rescore_sec=CACHE_RESCORE_SEC,
+                )
+            pool.meter = self._meter
+            self.pools[key] = pool
+        self.pools.move_to_end(key, last=True)
+        return pool
 
-            pid += 1
+    async def _fetch_from_pool(
+        self, buf: Buffer, pool: PostPool | PeriodIngester, user_filters: List[str], excludes: frozenset[str], lane: int,
+        rebuild: bool = False,
+    ) -> List[Post]:
+        allowed = compile_filters(user_filters, excludes)
+        collected: List[Post] = []
+        key = pool.key
+        pages = 0
+        if not pool.random_order:
+            if pool.rescore_due():
+                # пора обновить score окна — до того, как буфер возьмёт из него посты
+                await pool.grow(lane)
+                pages += 1
+            if rebuild:
+                # протухший буфер топа будет выброшен целиком: собираем его из всего окна,
+                # а не из дельты после курсора — иначе невыданные лучшие посты потерялись бы
+                posts, buf.cursors[key] = pool.read(0)
+                buf.restart(posts)
+                collected += buf.unserved(allowed.apply(posts))
+        while True:
+            posts, buf.cursors[key] = pool.read(buf.cursors.get(key, 0))
+            collected += buf.unserved(allowed.apply(posts))
+            if len(collected) >= self.refill_size or pages >= max(1, CACHE_MAX_PAGES):
+                break
+            got = await pool.grow(lane)
+            pages += 1
+            if not got:
+                # страница могла прийти по чужому вызову — дочитываем и выходим
+                posts, buf.cursors[key] = pool.read(buf.cursors.get(key, 0))
+                collected += buf.unserved(allowed.apply(posts))
+                break
+        if not collected and (rebuild or not buf.items) and not pool.random_order and pool.exhausted:
+            # весь топ периода уже выдан (и буфер доеден) — идём по нему по второму кругу, как и раньше
+            posts, buf.cursors[key] = pool.read(0)
+            buf.restart([])
+            collected = allowed.apply(posts)
+        CACHE_REFILL_PAGES.observe(pages, key[0])
+        return collected
 
+    async def _fetch(
+        self, buf: Buffer, user_filters: List[str], period: str, random_order: bool, lane: int = LANE_REFILL,
+        rebuild: bool = False,
+    ) -> List[Post]:
+        tags, excludes = split_query_tags(user_filters)
+        pool = self._get_pool(tags, period, random_order)
+        collected = await self._fetch_from_pool(buf, pool, user_filters, excludes, lane, rebuild)
         logging.info(
-            "cache refill (TOP): pages=%d, collected=%d/%d, period=%s, tags=%s",
-            pid, len(collected), self.refill_size, period, " ".join(tags_top)
+            "cache refill: collected=%d/%d, random=%s, period=%s, pool=%s, excludes=%s",
+            len(collected), self.refill_size, random_order, period, " ".join(tags), ",".join(sorted(excludes))
         )
 
         # Мягкий фолбек, чтобы не оставлять пользователя без ответа
-        if not collected:
-            await self._rate_limit()
-            tags_fallback = build_query_tags(user_filters, random_order=True)
-            raw = await fetch_by_tags(tags_fallback, limit=self.refill_size)
-            collected = [p for p in raw if is_post_allowed(p, user_filters)]
+        if not collected and not random_order:
+            fallback = self._get_pool(tags, period, random_order=True)
+            collected = await self._fetch_from_pool(buf, fallback, user_filters, excludes, lane)
             logging.info(
-                "cache refill (fallback RANDOM): got=%d, after_filter=%d, period=%s, tags=%s",
-                len(raw), len(collected), period, " ".join(tags_fallback)
+                "cache refill (fallback RANDOM): collected=%d, period=%s, pool=%s",
+                len(collected), period, " ".join(tags)
             )
+        return collected
 
-        buf.put_all(collected)
+    async def _refill(self, buf: Buffer, user_filters: List[str], period: str, random_order: bool, lane: int) -> None:
+        started = time.perf_counter()
+        # решение о пересборке принимается до чтения пула: от него зависит, откуда читать
+        rebuild = buf.expired()
+        try:
+            posts = await self._fetch(buf, user_filters, period, random_order, lane=lane, rebuild=rebuild)
+        except Exception as e:
+            logging.exception("cache refill failed: %s", e)
+            posts = []
+        CACHE_REFILL_SECONDS.observe(time.perf_counter() - started, "random" if random_order else period)
+        self.stats["refills"] += 1
+        if rebuild:
+            kept = {p.id for p in posts}
+            self._dropped([p for p in buf.posts() if p.id not in kept])   # merge() выбросит протухшие посты
+        if buf.merge(posts, replace=rebuild) == 0:
+            self.stats["refills_wasted"] += 1
+        self._enforce_limits()
 
-    async def get_post(self, user_filters: List[str], period: str = "week", random_order: bool = True) -> dict | None:
-        filters_key = ",".join(sorted(map(str.lower, user_filters)))
+    def _start_refill(
+        self, buf: Buffer, user_filters: List[str], period: str, random_order: bool, lane: int = LANE_REFILL
+    ) -> asyncio.Task:
+        # single-flight: на буфер не больше одного пополнения, остальные ждут его же
+        if buf.refill_task is not None and not buf.refill_task.done():
+            self.stats["refills_deduped"] += 1
+            return buf.refill_task
+        buf.refill_task = asyncio.create_task(self._refill(buf, list(user_filters), period, random_order, lane))
+        return buf.refill_task
+
+    async def get_post(
+        self, user_filters: List[str], period: str = "week", random_order: bool = True, lane: int = LANE_INTERACTIVE,
+        seen: Container[int] | None = None,
+    ) -> Post | None:
+        """seen — посты, уже показанные пользователю (проверка в памяти, см. database/seen.py)."""
+        started = time.perf_counter()
+        try:
+            return await self._get_post(user_filters, period, random_order, lane, seen)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.latency.observe(elapsed)
+            CACHE_GET_SECONDS.observe(elapsed, "random" if random_order else period)
+
+    async def _get_post(
+        self, user_filters: List[str], period: str, random_order: bool, lane: int, seen: Container[int] | None = None
+    ) -> Post | None:
+        filters_key = self.filters_key(user_filters)
         key = self._key("random" if random_order else period, filters_key)
         buf = self._get_or_create(key)
+
+        # stale-while-revalidate: протухший, но не слишком старый буфер отдаёт сразу, а обновляется в фоне
+        if buf.items and not buf.hard_stale():
+            post = buf.pop(seen)
+            if seen is not None and post.id in seen:
+                # всё ближайшее пользователь уже видел — подтягиваем свежие посты
+                self._start_refill(buf, user_filters, period, random_order)
+            if buf.expired():
+                self.stats["stale_hits"] += 1
+                CACHE_REQUESTS.inc(key[0], "stale")
+                self._start_refill(buf, user_filters, period, random_order)
+            else:
+                self.stats["hits"] += 1
+                CACHE_REQUESTS.inc(key[0], "hit")
+                if len(buf.items) < self.refill_size // 3:
+                    self._start_refill(buf, user_filters, period, random_order)
+            self._served(key, buf)
+            return post
+
+        self.stats["misses"] += 1
+        CACHE_REQUESTS.inc(key[0], "miss")
         async with buf.lock:
-            if buf.expired() or not buf.items:
-                await self._refill(buf, user_filters, period, random_order)
+            if not buf.items or buf.hard_stale():
+                # shield: отмена ожидающего не должна отменять общий для всех refill
+                await asyncio.shield(self._start_refill(buf, user_filters, period, random_order, lane=lane))
                 if not buf.items:
                     return None
-            post = buf.pop()
-            if len(buf.items) < self.refill_size // 3:
-                asyncio.create_task(self._refill(buf, user_filters, period, random_order))
+            post = buf.pop(seen)
+            if len(buf.items) < self.refill_size // 3 or (seen is not None and post.id in seen):
+                self._start_refill(buf, user_filters, period, random_order)
+            self._served(key, buf)
             return post
-        
+
+    async def warm(
+        self, user_filters: List[str], period: str = "week", random_order: bool = True, lane: int = LANE_REFILL,
+        fresh_for: float = 0.0,
+    ) -> Post | None:
+        """
+        Заполняет буфер заранее, ничего не выдавая, и возвращает пост, который уйдёт первым.
+        fresh_for — буфер должен остаться свежим ещё столько секунд (иначе пополняется сейчас).
+        """
+        key = self._key("random" if random_order else period, self.filters_key(user_filters))
+        buf = self._get_or_create(key)
+        if not buf.items or buf.expires_at < time.time() + fresh_for:
+            await asyncio.shield(self._start_refill(buf, user_filters, period, random_order, lane=lane))
+        head = buf.peek(1)
+        return head[0] if head else None
+
+    def snapshot(self) -> Dict[str, object]:
+        pages = sum(p.pages_fetched for p in self.pools.values())
+        served = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "buffers": len(self.buffers),
+            "buffer_bytes": sum(b.nbytes for b in self.buffers.values()),
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self.evictions),
+            "pools": len(self.pools),
+            "pool_bytes": sum(p.nbytes for p in self.pools.values()),
+            "total_bytes": self.total_bytes,
+            "pool_pages": pages,
+            "api_calls_per_request": pages / served if served else 0.0,
+            "latency": self.latency.snapshot(),
+        }
+
     # На всякий случай
     def clear(self):
+        for buf in self.buffers.values():
+            buf.meter = None
+            self._dropped(buf.posts())
+        for pool in self.pools.values():
+            pool.meter = None
         self.buffers.clear()
+        self.pools.clear()
+        self.total_bytes = 0
+
+cache = Cache(
+    refill_size=CACHE_REFILL_SIZE,
+    ttl_sec=CACHE_TTL,
+    max_keys=CACHE_MAX_KEYS,
+    stale_sec=CACHE_STALE_SEC,
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    hot_keys=PREFETCH_HOT_KEYS,
+    prefetch_depth=PREFETCH_DEPTH,
+)
+
 
-cache = Cache(refill_size=CACHE_REFILL_SIZE, ttl_sec=CACHE_TTL, max_keys=CACHE_MAX_KEYS)
\ No newline at end of file
+@registry.collector
+def _collect_cache() -> None:
+    CACHE_BUFFERS.set(len(cache.buffers))
+    CACHE_BYTES.set(sum(b.nbytes for b in cache.buffers.values()), "buffers")
+    CACHE_BYTES.set(sum(p.nbytes for p in cache.pools.values()), "pools")
@@ -0,0 +1,184 @@
+# services/coord.py
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
+
+from config import COORD_BACKEND, COORD_PAGE_RETENTION_SEC
+from database import coord as db
+
+CLEANUP_EVERY_SEC = 60
+POOL_LOCK_LEASE_SEC = 60    # аренда блокировки пула; упавший или зависший экземпляр отдаёт её по истечении
+POOL_LOCK_POLL_SEC = 0.2
+LOCAL_COOLDOWNS_MAX = 100000
+
+Page = Tuple[int, Dict[str, Any], List[Dict[str, Any]]]   # (seq, meta, посты в виде dict)
+
+
+class LocalCoordinator:
+    """
+    Один экземпляр бота: всё состояние в процессе. Общего журнала страниц нет,
+    токены берутся из локального ведра ограничителя, кулдауны — в dict.
+    """
+
+    shared = False
+
+    def __init__(self):
+        # ключ -> момент окончания; порядок вставки ≈ порядок истечения
+        self._cooldowns: OrderedDict[str, float] = OrderedDict()
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def pause(self, name: str, seconds: float) -> None:
+        pass
+
+    def _prune(self, now: float) -> None:
+        # истёкшие снимаем с головы; сверх лимита вытесняем старейшие (это лишь раньше снимет кулдаун)
+        while self._cooldowns:
+            _, until = next(iter(self._cooldowns.items()))
+            if until > now and len(self._cooldowns) <= LOCAL_COOLDOWNS_MAX:
+                return
+            self._cooldowns.popitem(last=False)
+
+    async def cooldown(self, key: str, seconds: float) -> float:
+        """0 — кулдаун поставлен (действие разрешено), иначе сколько секунд ещё ждать."""
+        now = time.monotonic()
+        until = self._cooldowns.get(key, 0.0)
+        if until > now:
+            return until - now
+        self._cooldowns.pop(key, None)
+        self._cooldowns[key] = now + seconds
+        self._prune(now)
+        return 0.0
+
+    @asynccontextmanager
+    async def pool_lock(self, key: str) -> AsyncIterator[None]:
+        # внутри процесса single-flight уже обеспечивает _grow_task пула
+        yield
+
+    async def read_pages(self, key: str, after_seq: int, max_age_sec: float | None = None) -> List[Page]:
+        return []
+
+    async def publish_page(self, key: str, meta: Dict[str, Any], posts: List[Dict[str, Any]]) -> int:
+        return 0
+
+
+class PostgresCoordinator(LocalCoordinator):
+    """
+    Несколько экземпляров за балансировщиком: общий token bucket к Gelbooru,
+    общие кулдауны и журнал загруженных страниц пулов (coord_pages) в Postgres.
+    Загрузка страницы пула идёт под блокировкой-арендой (coord_locks), так что один и тот же
+    запрос к API в кластере не выполняется дважды; соединение из пула БД при этом не держится
+    ни на время HTTP, ни на время ожидания. При ошибках БД — откат к локальному поведению.
+    """
+
+    shared = True
+
+    def __init__(self, page_retention_sec: float):
+        super().__init__()
+        self.page_retention_sec = page_retention_sec
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._cleaner: asyncio.Task | None = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CLEANUP_EVERY_SEC)
+            try:
+                await db.cleanup(self.page_retention_sec)
+            except Exception as e:
+                logging.warning("coord cleanup failed: %s", e)
+
+    async def start(self) -> None:
+        if self._cleaner is None:
+            self._cleaner = asyncio.create_task(self._cleanup_loop())
+        logging.info("Coordination backend: postgres")
+
+    async def close(self) -> None:
+        if self._cleaner is not None:
+            self._cleaner.cancel()
+            self._cleaner = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def take_token(self, name: str, rate: float, burst: int) -> float:
+        """Токен из общего ведра в БД (services/ratelimit); у локального бэкенда такого ведра нет."""
+        return await db.take_token(name, rate, burst)
+
+    def pause(self, name: str, seconds: float) -> None:
+        # feedback() синхронный — пауза уходит в БД фоном
+        async def _pause():
+            try:
+                await db.pause_bucket(name, seconds)
+            except Exception as e:
+                logging.warning("coord pause failed: %s", e)
+
+        task = asyncio.create_task(_pause())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def cooldown(self, key: str, seconds: float) -> float:
+        try:
+            return await db.try_cooldown(key, seconds)
+        except Exception as e:
+            logging.warning("coord cooldown failed, using local: %s", e)
+            return await super().cooldown(key, seconds)
+
+    async def _lock(self, key: str) -> bool:
+        # ждём, пока держатель отпустит ключ или его аренда истечёт; дольше аренды не ждём
+        deadline = time.monotonic() + POOL_LOCK_LEASE_SEC
+        while not await db.try_lock(key, self.owner, POOL_LOCK_LEASE_SEC):
+            if time.monotonic() >= deadline:
+                logging.warning("coord lock %s still busy, fetching without it", key)
+                return False
+            await asyncio.sleep(POOL_LOCK_POLL_SEC)
+        return True
+
+    @asynccontextmanager
+    async def pool_lock(self, key: str) -> AsyncIterator[None]:
+        try:
+            locked = await self._lock(key)
+        except Exception as e:
+            logging.warning("coord lock failed, fetching without it: %s", e)
+            locked = False
+        try:
+            yield
+        finally:
+            if locked:
+                try:
+                    await db.unlock(key, self.owner)
+                except Exception as e:
+                    logging.warning("coord unlock failed, lease will expire: %s", e)
+
+    async def read_pages(self, key: str, after_seq: int, max_age_sec: float | None = None) -> List[Page]:
+        try:
+            return await db.read_pages(key, after_seq, max_age_sec)
+        except Exception as e:
+            logging.warning("coord read_pages failed: %s", e)
+            return []
+
+    async def publish_page(self, key: str, meta: Dict[str, Any], posts: List[Dict[str, Any]]) -> int:
+        try:
+            return await db.publish_page(key, meta, posts)
+        except Exception as e:
+            logging.warning("coord publish_page failed: %s", e)
+            return 0
+
+
+def _make_coordinator() -> LocalCoordinator:
+    if COORD_BACKEND == "postgres":
+        return PostgresCoordinator(COORD_PAGE_RETENTION_SEC)
+    if COORD_BACKEND != "local":
+        raise RuntimeError(f"Unknown COORD_BACKEND={COORD_BACKEND!r} (expected local or postgres)")
+    return LocalCoordinator()
+
+
+coord = _make_coordinator()
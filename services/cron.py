@@ -0,0 +1,75 @@
+# services/cron.py
+from datetime import datetime, timedelta
+from typing import FrozenSet, List
+
+# (минимум, максимум) для полей «минута час день месяц день_недели»
+_BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(spec: str, lo: int, hi: int) -> FrozenSet[int]:
+    values: set[int] = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+            if step < 1:
+                raise ValueError(f"bad cron step: {spec!r}")
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if not (lo <= start <= end <= hi):
+            raise ValueError(f"cron value out of range {lo}-{hi}: {spec!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    """
+    Расписание в формате cron: «минута час день месяц день_недели» (0 и 7 — воскресенье).
+    Поддерживает *, списки, диапазоны и шаги. Как в cron, если заданы и день месяца,
+    и день недели, подходит любой из них. Время — локальное, без часового пояса.
+    """
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        fields: List[FrozenSet[int]] = [_parse_field(p, lo, hi) for p, (lo, hi) in zip(parts, _BOUNDS)]
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = frozenset(d % 7 for d in weekdays)
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        in_month = dt.day in self.days
+        in_week = (dt.weekday() + 1) % 7 in self.weekdays     # datetime: понедельник = 0, cron: воскресенье = 0
+        if self._any_day or self._any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, dt: datetime) -> datetime:
+        """Ближайший момент расписания строго после dt."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression never fires: {self.expr!r}")
+
+    def __repr__(self) -> str:
+        return f"Cron({self.expr!r})"
@@ -0,0 +1,105 @@
+# services/file_ids.py
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+from aiogram.types import Message
+
+from config import FILE_ID_LRU_SIZE
+from database.media import get_file_ids, save_file_id, delete_file_id
+
+
+def extract_file_id(msg: Message | None, kind: str) -> str | None:
+    """Достаёт file_id загруженного файла из ответа Telegram."""
+    if msg is None:
+        return None
+    if kind == "photo" and msg.photo:
+        return msg.photo[-1].file_id
+    if kind == "video" and msg.video:
+        return msg.video.file_id
+    if kind == "animation" and msg.animation:
+        return msg.animation.file_id
+    if msg.document:
+        return msg.document.file_id
+    return None
+
+
+class FileIdCache:
+    """
+    Кэш Telegram file_id по (post_id, kind): LRU в памяти перед таблицей media_file_ids.
+    В LRU хранится и «пустой» результат, чтобы не ходить в БД повторно за неизвестными постами.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lru: OrderedDict[str, Dict[str, str]] = OrderedDict()
+        self._upload_locks: Dict[str, List] = {}  # post_id -> [Lock, число ожидающих]
+
+    def _remember(self, post_id: str, kinds: Dict[str, str]) -> None:
+        self._lru[post_id] = kinds
+        self._lru.move_to_end(post_id, last=True)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def peek(self, post_id: str) -> bool:
+        """Есть ли в LRU хоть один file_id поста (без БД и без обновления порядка)."""
+        return bool(self._lru.get(post_id))
+
+    async def _lookup(self, post_id: str) -> Dict[str, str] | None:
+        kinds = self._lru.get(post_id)
+        if kinds is None:
+            try:
+                kinds = await get_file_ids(post_id)
+            except Exception as e:
+                logging.warning("file_id lookup failed for post %s: %s", post_id, e)
+                return None
+            self._remember(post_id, kinds)
+        else:
+            self._lru.move_to_end(post_id, last=True)
+        return kinds
+
+    async def get(self, post_id: str, kind: str) -> str | None:
+        kinds = await self._lookup(post_id)
+        return kinds.get(kind) if kinds else None
+
+    async def known(self, post_id: str) -> bool:
+        """Есть ли у поста хоть один file_id — в LRU или, если там поста нет, в БД."""
+        return bool(await self._lookup(post_id))
+
+    async def put(self, post_id: str, kind: str, file_id: str) -> None:
+        kinds = dict(self._lru.get(post_id) or {})
+        kinds[kind] = file_id
+        self._remember(post_id, kinds)
+        try:
+            await save_file_id(post_id, kind, file_id)
+        except Exception as e:
+            logging.warning("file_id save failed for post %s/%s: %s", post_id, kind, e)
+
+    async def evict(self, post_id: str, kind: str) -> None:
+        kinds = self._lru.get(post_id)
+        if kinds is not None:
+            kinds.pop(kind, None)
+        try:
+            await delete_file_id(post_id, kind)
+        except Exception as e:
+            logging.warning("file_id delete failed for post %s/%s: %s", post_id, kind, e)
+
+    @asynccontextmanager
+    async def upload_lock(self, post_id: str) -> AsyncIterator[None]:
+        """Один аплоад на пост: остальные ждут и затем отправляют уже сохранённый file_id."""
+        entry = self._upload_locks.get(post_id)
+        if entry is None:
+            entry = self._upload_locks[post_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._upload_locks.pop(post_id, None)
+
+
+file_ids = FileIdCache(max_size=FILE_ID_LRU_SIZE)
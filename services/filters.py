@@ -1,5 +1,8 @@
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+
 from database.filters import get_filters, add_filter, remove_filter
+from parsers.models import Post, Rating
 
 async def get_filters_inline_keyboard(user_id: int) -> InlineKeyboardMarkup:
     filters = await get_filters(user_id)
@@ -20,56 +23,52 @@ def get_rating_label(rating: str) -> str:
     r = (rating or "").lower()
     return {"s": "✅ Safe", "q": "⚠️ Questionable", "e": "🔞 Explicit"}.get(r, "❔ Unknown")
 
-def _extract_ext(post: dict) -> str:
-    file = post.get("file") or {}
-    ext = (file.get("ext") or "").lower()
-    if ext:
-        return ext
-    url = (file.get("url") or post.get("file_url") or "").lower()
-    if "." in url:
-        ext = url.rsplit(".", 1)[-1].split("?")[0]
-    return ext or ""
-
-def _extract_tags_set(post: dict) -> set[str]:
-    t = post.get("tags")
-    tags: set[str] = set()
-    # e621-подобный: dict групп
-    if isinstance(t, dict):
-        for v in t.values():
-            if isinstance(v, list):
-                tags.update(x.lower() for x in v)
-    # строки (gelbooru xml/json без нормализации)
-    if isinstance(t, str):
-        tags.update(x.lower() for x in t.split() if x)
-    # запасной путь
-    tag_string = post.get("tag_string")
-    if isinstance(tag_string, str):
-        tags.update(x.lower() for x in tag_string.split() if x)
-    return tags
-
-def is_post_allowed(post: dict, filters: list[str]) -> bool:
-    fset = {f.lower() for f in (filters or [])}
-    allowed_ext = {"jpg", "jpeg", "png", "gif", "webp", "mp4", "webm"}
-
-    if _extract_ext(post) not in allowed_ext:
-        return False
-
-    tags = _extract_tags_set(post)
-
-    if {"gore", "feces", "urine", "diaper", "pregnant"} & tags:
-        return False
-
-    if "sfw" in fset:
-        if (post.get("rating") or "").lower() == "s":
+ALLOWED_EXT = frozenset({"jpg", "jpeg", "png", "webp", "gif", "mp4", "webm"})
+BANNED_TAGS = frozenset({"gore", "feces", "urine", "diaper", "pregnant"})
+
+
+class PostFilter:
+    """
+    Набор фильтров пользователя, скомпилированный один раз: все множества готовы заранее,
+    проверка поста — несколько операций над frozenset без пересборки чего-либо.
+    """
+
+    __slots__ = ("blocked_tags", "blocked_ratings", "required_tag")
+
+    def __init__(self, filters: list[str], exclude: frozenset[str] = frozenset()):
+        fset = frozenset(f.lower() for f in (filters or []))
+        self.blocked_tags = BANNED_TAGS | fset | exclude
+        if "sfw" in fset:
+            self.blocked_ratings = frozenset({Rating.SAFE})
+        elif "nsfw" in fset:
+            self.blocked_ratings = frozenset({Rating.QUESTIONABLE, Rating.EXPLICIT})
+        else:
+            self.blocked_ratings = frozenset()
+        self.required_tag = "1girl" if "gay" in fset else None
+
+    def __call__(self, post: Post) -> bool:
+        if post.file_ext not in ALLOWED_EXT:
             return False
-    elif "nsfw" in fset:
-        if (post.get("rating") or "").lower() in {"e", "q"}:
+        if post.rating in self.blocked_ratings:
             return False
+        tags = post.tags
+        if self.required_tag is not None and self.required_tag not in tags:
+            return False
+        return self.blocked_tags.isdisjoint(tags)
+
+    def apply(self, posts: list[Post]) -> list[Post]:
+        """Фильтрует целую страницу за один проход."""
+        return [p for p in posts if self(p)]
+
+
+@lru_cache(maxsize=1024)
+def _compile(filters_key: tuple[str, ...], exclude: frozenset[str]) -> PostFilter:
+    return PostFilter(list(filters_key), exclude)
+
 
-    if ("gay" in fset) and ("1girl" not in tags):
-        return False
+def compile_filters(filters: list[str], exclude: frozenset[str] = frozenset()) -> PostFilter:
+    return _compile(tuple(sorted(f.lower() for f in (filters or []))), frozenset(exclude))
 
-    if fset & tags:
-        return False
 
-    return True
\ No newline at end of file
+def is_post_allowed(post: Post, filters: list[str], exclude: frozenset[str] | set[str] = frozenset()) -> bool:
+    return compile_filters(filters, frozenset(exclude))(post)
@@ -0,0 +1,160 @@
+# services/http.py
+import logging
+from typing import Any, Callable, Dict
+
+from aiohttp import BaseConnector, ClientSession, ClientTimeout, TraceConfig
+from aiohttp_socks import ProxyConnector
+
+from config import (
+    PROXY_URL,
+    USER_AGENT,
+    HTTP_API_LIMIT,
+    HTTP_API_LIMIT_PER_HOST,
+    HTTP_CDN_LIMIT,
+    HTTP_CDN_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE,
+    HTTP_DNS_TTL,
+)
+from services.metrics import registry
+
+API_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "application/json,text/*;q=0.9,*/*;q=0.8",
+    "Referer": "https://gelbooru.com/",
+}
+CDN_HEADERS = {"User-Agent": USER_AGENT, "Referer": "https://gelbooru.com/"}
+
+
+def _make_connector(limit: int, limit_per_host: int) -> ProxyConnector:
+    if not PROXY_URL or not PROXY_URL.startswith(("socks5://", "socks5h://", "socks4://", "socks4a://")):
+        raise RuntimeError("PROXY_URL must be socks5/socks4 URL (set in .env)")
+    return ProxyConnector.from_url(
+        PROXY_URL,
+        rdns=True,
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_TTL,
+    )
+
+
+class _PoolCounters:
+    """Счётчики новых/переиспользованных соединений одного пула (через TraceConfig)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+
+    def trace_config(self) -> TraceConfig:
+        tc = TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.requests += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.reused += 1
+
+        tc.on_request_start.append(on_request_start)
+        tc.on_connection_create_end.append(on_connection_create_end)
+        tc.on_connection_reuseconn.append(on_connection_reuseconn)
+        return tc
+
+
+class HttpClients:
+    """
+    Долгоживущие HTTP-сессии: отдельный keep-alive пул для API Gelbooru
+    и отдельный — для скачивания медиа с CDN. Запускаются и закрываются в bot.main().
+    """
+
+    def __init__(self):
+        self._api: ClientSession | None = None
+        self._cdn: ClientSession | None = None
+        self._api_counters = _PoolCounters()
+        self._cdn_counters = _PoolCounters()
+
+    async def start(self, connector_factory: Callable[[int, int], BaseConnector] = _make_connector) -> None:
+        # connector_factory подменяется только в bench/ — там нет прокси, а серверы локальные
+        if self._api is None:
+            self._api = ClientSession(
+                connector=connector_factory(HTTP_API_LIMIT, HTTP_API_LIMIT_PER_HOST),
+                timeout=ClientTimeout(total=20, connect=10, sock_read=15),
+                headers=API_HEADERS,
+                trace_configs=[self._api_counters.trace_config()],
+            )
+        if self._cdn is None:
+            self._cdn = ClientSession(
+                connector=connector_factory(HTTP_CDN_LIMIT, HTTP_CDN_LIMIT_PER_HOST),
+                timeout=ClientTimeout(total=45, connect=12, sock_read=40),
+                headers=CDN_HEADERS,
+                trace_configs=[self._cdn_counters.trace_config()],
+            )
+        logging.info("HTTP pools started: %s", self.stats())
+
+    async def close(self) -> None:
+        logging.info("HTTP pools closing: %s", self.stats())
+        for s in (self._api, self._cdn):
+            if s is not None and not s.closed:
+                await s.close()
+        self._api = None
+        self._cdn = None
+
+    def api(self) -> ClientSession:
+        if self._api is None:
+            raise RuntimeError("HTTP clients have not been started. Call http_clients.start() first.")
+        return self._api
+
+    def cdn(self) -> ClientSession:
+        if self._cdn is None:
+            raise RuntimeError("HTTP clients have not been started. Call http_clients.start() first.")
+        return self._cdn
+
+    @staticmethod
+    def _pool_stats(session: ClientSession | None, counters: _PoolCounters) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "requests": counters.requests,
+            "created": counters.created,
+            "reused": counters.reused,
+        }
+        if session is None or session.closed:
+            stats["open"] = False
+            return stats
+        conn = session.connector
+        # у TCPConnector нет публичного API для этого — берём внутренние поля аккуратно
+        idle = getattr(conn, "_conns", {}) or {}
+        acquired = getattr(conn, "_acquired", ()) or ()
+        stats.update({
+            "open": True,
+            "limit": conn.limit,
+            "limit_per_host": conn.limit_per_host,
+            "idle": sum(len(v) for v in idle.values()),
+            "in_use": len(acquired),
+        })
+        return stats
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "api": self._pool_stats(self._api, self._api_counters),
+            "cdn": self._pool_stats(self._cdn, self._cdn_counters),
+        }
+
+
+http_clients = HttpClients()
+
+HTTP_CONNECTIONS = registry.gauge("bot_http_connections", "Соединения пулов aiohttp", ("pool", "state"))
+HTTP_POOL_EVENTS = registry.gauge("bot_http_pool_events", "Запросы и новые/переиспользованные соединения с запуска", ("pool", "event"))
+
+
+@registry.collector
+def _collect_http() -> None:
+    for pool, st in http_clients.stats().items():
+        for event in ("requests", "created", "reused"):
+            HTTP_POOL_EVENTS.set(st[event], pool, event)
+        if st["open"]:
+            HTTP_CONNECTIONS.set(st["idle"], pool, "idle")
+            HTTP_CONNECTIONS.set(st["in_use"], pool, "in_use")
+            HTTP_CONNECTIONS.set(st["limit"], pool, "limit")
@@ -1,18 +1,37 @@
+import asyncio
+import datetime
 import logging
 import mimetypes
+import time
+from collections import Counter
+from typing import AsyncIterator
 from aiogram import Bot
-from aiogram.types import BufferedInputFile
-from aiohttp import ClientSession, ClientTimeout
-from aiohttp_socks import ProxyConnector
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter, TelegramForbiddenError
+from aiogram.types import Message
 
-from config import PROXY_URL, USER_AGENT
-from database.users import get_username, load_users
-from database.filters import get_filters
+from database.users import iter_subscribers, count_subscribers
+from database.profiles import profiles
+from database.seen import SeenFilter, seen_posts
+from parsers.models import Post
 from services.filters import get_rating_label
 from services.cache import cache
+from services.media import download
+from services.prefetch import prefetcher
+from services.prepare import photos, wants_photo, MAX_PHOTO_MB, PHOTO_EXTS, CONVERT_EXTS
+from services.file_ids import file_ids, extract_file_id
+from services.broadcast import Broadcast
+from services.metrics import registry
+from services.ratelimit import LANE_INTERACTIVE, LANE_BROADCAST
 
 FURRY_TUESDAY_CAPTION = ""
-MAX_PHOTO_MB = 10
+PREWARM_CONCURRENCY = 4
+
+# ошибки Telegram, означающие, что сам file_id больше не годится (а не что-то с получателем)
+STALE_FILE_ID_ERRORS = ("file identifier", "file_id", "file reference", "type of file mismatch")
+
+TELEGRAM_SEND_SECONDS = registry.histogram(
+    "bot_telegram_send_seconds", "Отправка медиа в Telegram: по file_id или с загрузкой файла", ("kind", "source", "result")
+)
 
 
 def _guess_ext(ext: str, content_type: str) -> str:
@@ -22,85 +41,257 @@ def _guess_ext(ext: str, content_type: str) -> str:
     return ext or "jpg"
 
 
-async def _download(url: str) -> tuple[bytes, int, str]:
-    connector = ProxyConnector.from_url(PROXY_URL, rdns=True)
-    timeout = ClientTimeout(total=45, connect=12, sock_read=40)
-    headers = {"User-Agent": USER_AGENT, "Referer": "https://gelbooru.com/"}
-    async with ClientSession(connector=connector, timeout=timeout, headers=headers) as s:
-        async with s.get(url) as r:
-            r.raise_for_status()
-            ctype = r.headers.get("Content-Type", "") or ""
-            decl = int(r.headers.get("Content-Length") or 0)
-            data = await r.read()
-            size = decl or len(data)
-            return data, size, ctype
+def _candidate_kinds(ext: str) -> list[str]:
+    # в каком виде пост мог быть загружен раньше (фото сверх лимита уходит документом)
+    ext = (ext or "").lower()
+    if ext in PHOTO_EXTS or ext in CONVERT_EXTS:
+        return ["photo", "document"]
+    if ext == "gif":
+        return ["animation", "document"]
+    if ext == "mp4":
+        return ["video", "document"]
+    return ["document"]
 
 
-async def send_media(bot: Bot, user_id: int, file_url: str, file_ext: str, caption: str):
+async def _send_by_kind(bot: Bot, user_id: int, kind: str, media, caption: str) -> Message:
+    source = "file_id" if isinstance(media, str) else "upload"
+    started = time.perf_counter()
+    result = "error"
     try:
-        data, size, ctype = await _download(file_url)
-        ext = _guess_ext(file_ext, ctype)
-        buf = BufferedInputFile(data, filename=f"file.{ext}")
-        mb = size / (1024 * 1024)
-        if ext in {"jpg", "jpeg", "png", "webp"} and mb <= MAX_PHOTO_MB:
-            await bot.send_photo(user_id, buf, caption=caption)
-            return
-        if ext == "gif":
-            await bot.send_animation(user_id, buf, caption=caption)
-            return
-        if ext == "mp4":
-            await bot.send_video(user_id, buf, caption=caption)
-            return
-        await bot.send_document(user_id, buf, caption=caption)
+        msg = await _send_by_kind_raw(bot, user_id, kind, media, caption)
+        result = "ok"
+        return msg
+    finally:
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, kind, source, result)
+
+
+async def _send_by_kind_raw(bot: Bot, user_id: int, kind: str, media, caption: str) -> Message:
+    if kind == "photo":
+        return await bot.send_photo(user_id, media, caption=caption)
+    if kind == "animation":
+        return await bot.send_animation(user_id, media, caption=caption)
+    if kind == "video":
+        return await bot.send_video(user_id, media, caption=caption)
+    return await bot.send_document(user_id, media, caption=caption)
+
+
+async def _remember_upload(post_id: str | None, kind: str, msg: Message | None) -> None:
+    if not post_id:
+        return
+    file_id = extract_file_id(msg, kind)
+    if file_id:
+        await file_ids.put(post_id, kind, file_id)
+
+
+def _is_stale_file_id(e: TelegramBadRequest) -> bool:
+    message = (e.message or "").lower()
+    return any(marker in message for marker in STALE_FILE_ID_ERRORS)
+
+
+async def _send_cached(bot: Bot, user_id: int, post_id: str, file_ext: str, caption: str) -> bool:
+    """
+    Пробует отправить пост по сохранённому file_id без скачивания. Протухшие file_id удаляются;
+    прочие ошибки (chat not found, user is deactivated…) относятся к получателю — пробрасываются,
+    а общий file_id остаётся для остальных.
+    """
+    for kind in _candidate_kinds(file_ext):
+        file_id = await file_ids.get(post_id, kind)
+        if not file_id:
+            continue
+        try:
+            await _send_by_kind(bot, user_id, kind, file_id, caption)
+            return True
+        except TelegramBadRequest as e:
+            if not _is_stale_file_id(e):
+                raise
+            logging.info(f"Stale file_id for post {post_id} ({kind}): {e}")
+            await file_ids.evict(post_id, kind)
+    return False
+
+
+async def _upload_media(
+    bot: Bot, user_id: int, file_url: str, file_ext: str, caption: str, post_id: str | None, post: Post | None = None
+):
+    media = None
+    try:
+        try:
+            # следующий пост горячего буфера обычно уже скачан фоном
+            media = await prefetcher.take(post_id) if post_id else None
+            prepared = None
+            if post is not None and wants_photo(post):
+                # оригинал уходит в подготовку: вернётся как есть, уменьшенным, заменится на sample
+                # или, если фото не получилось, вернётся обратно для отправки документом
+                prepared, media = await photos.prepare(post, media)
+            if prepared is not None:
+                media, ext = prepared
+                kind = "photo"
+            else:
+                media = media or await download(file_url)
+                ext = _guess_ext(file_ext, media.ctype)
+                mb = media.size / (1024 * 1024)
+                if ext in PHOTO_EXTS and mb <= MAX_PHOTO_MB:
+                    kind = "photo"
+                elif ext == "gif":
+                    kind = "animation"
+                elif ext == "mp4":
+                    kind = "video"
+                else:
+                    kind = "document"
+            msg = await _send_by_kind(bot, user_id, kind, media.input_file(f"file.{ext}"), caption)
+        finally:
+            # что бы ни упало — подготовка, скачивание или отправка, — временный файл не остаётся
+            if media is not None:
+                media.cleanup()
+        await _remember_upload(post_id, kind, msg)
+    except (TelegramRetryAfter, TelegramForbiddenError):
+        # решает вызывающий (рассылка ждёт/отписывает), фолбек тут бесполезен
+        raise
     except Exception as e:
         logging.error(f"Send media failed ({file_ext}): {e}")
         try:
-            await bot.send_document(user_id, file_url, caption=caption)
+            msg = await bot.send_document(user_id, file_url, caption=caption)
+            await _remember_upload(post_id, "document", msg)
         except Exception:
             await bot.send_message(user_id, f"{caption}\n{file_url}")
 
 
+async def send_media(
+    bot: Bot, user_id: int, file_url: str, file_ext: str, caption: str, post_id: str | None = None, post: Post | None = None
+):
+    if not post_id:
+        await _upload_media(bot, user_id, file_url, file_ext, caption, post_id, post)
+        return
+    if await _send_cached(bot, user_id, post_id, file_ext, caption):
+        prefetcher.forget(post_id)     # ушёл по file_id — предзагруженный файл больше не нужен
+        return
+    async with file_ids.upload_lock(post_id):
+        # пока ждали, пост мог загрузить кто-то другой
+        if await _send_cached(bot, user_id, post_id, file_ext, caption):
+            prefetcher.forget(post_id)
+            return
+        await _upload_media(bot, user_id, file_url, file_ext, caption, post_id, post)
+
+
+async def _load_profile(user_id: int) -> tuple[list[str], str | None]:
+    profile = await profiles.get(user_id)
+    if profile is None:
+        return [], None
+    return profile.filters, profile.username
+
+
 async def send_random_image(bot: Bot, user_id: int):
-    filters = await get_filters(user_id)
-    username = await get_username(user_id)
+    filters, username = await _load_profile(user_id)
+    seen = await seen_posts.get(user_id)
     for _ in range(10):
-        post = await cache.get_post(user_filters=filters, period="week", random_order=True)
+        post = await cache.get_post(user_filters=filters, period="week", random_order=True, seen=seen)
         if not post:
             break
-        file_url = post["file"]["url"]
-        file_ext = post["file"]["ext"]
-        post_url = post.get("page_url", "")
-        rating = get_rating_label(post.get("rating", ""))
-        caption = f"{rating}\n{post_url}"
-        await send_media(bot, user_id, file_url, file_ext, caption)
-        logging.info(f"Отправлен пост {post['id']} пользователю {user_id} - @{username} (рейтинг: {rating})")
+        rating = get_rating_label(post.rating)
+        caption = f"{rating}\n{post.page_url}"
+        await send_media(bot, user_id, post.file_url, post.file_ext, caption, post_id=str(post.id), post=post)
+        await seen_posts.add(user_id, post.id)
+        logging.info(f"Отправлен пост {post.id} пользователю {user_id} - @{username} (рейтинг: {rating})")
         return
     await bot.send_message(user_id, "😞 Не удалось найти подходящую случайную картинку по вашим фильтрам.")
 
 
-async def send_image(bot: Bot, user_id: int, period: str = "week", caption: str = ""):
-    filters = await get_filters(user_id)
-    username = await get_username(user_id)
-    post = await cache.get_post(user_filters=filters, period=period, random_order=False)
+async def _resolve_top_post(
+    filters: list[str], period: str, lane: int = LANE_INTERACTIVE, seen: SeenFilter | None = None
+) -> Post | None:
+    post = await cache.get_post(user_filters=filters, period=period, random_order=False, lane=lane, seen=seen)
     if not post:
         logging.info("Top by period returned nothing; fallback to random-order cache")
-        post = await cache.get_post(user_filters=filters, period=period, random_order=True)
+        post = await cache.get_post(user_filters=filters, period=period, random_order=True, lane=lane, seen=seen)
+    return post
+
+
+async def _send_post(bot: Bot, user_id: int, post: Post | None, caption: str = "", username: str | None = None):
     if not post:
         await bot.send_message(user_id, "😞 Не удалось найти подходящую картинку по вашим фильтрам.")
         return
-    file_url = post["file"]["url"]
-    file_ext = post["file"]["ext"]
-    post_url = post.get("page_url", "")
-    rating = get_rating_label(post.get("rating", ""))
-    full_caption = caption + f"{rating}\n{post_url}"
-    await send_media(bot, user_id, file_url, file_ext, full_caption)
-    logging.info(f"Отправлен пост {post['id']} пользователю {user_id} - @{username} (рейтинг: {rating})")
-
-
-async def send_image_toeveryone(bot: Bot, period: str = "week"):
-    users = await load_users()
-    for user_id in users:
-        try:
-            await send_image(bot, user_id, period=period, caption=FURRY_TUESDAY_CAPTION)
-        except Exception as e:
-            logging.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")      
\ No newline at end of file
+    rating = get_rating_label(post.rating)
+    full_caption = caption + f"{rating}\n{post.page_url}"
+    await send_media(bot, user_id, post.file_url, post.file_ext, full_caption, post_id=str(post.id), post=post)
+    logging.info(f"Отправлен пост {post.id} пользователю {user_id} - @{username} (рейтинг: {rating})")
+
+
+async def send_image(bot: Bot, user_id: int, period: str = "week", caption: str = ""):
+    filters, username = await _load_profile(user_id)
+    post = await _resolve_top_post(filters, period, seen=await seen_posts.get(user_id))
+    await _send_post(bot, user_id, post, caption, username)
+    if post:
+        await seen_posts.add(user_id, post.id)
+
+
+async def _prewarm_group(filters: list[str], period: str, fresh_for: float) -> str:
+    # тот же выбор, что у _resolve_top_post, но без выдачи поста
+    post = await cache.warm(filters, period, random_order=False, lane=LANE_BROADCAST, fresh_for=fresh_for)
+    if post is None:
+        post = await cache.warm(filters, period, random_order=True, lane=LANE_BROADCAST, fresh_for=fresh_for)
+    if post is None:
+        return "empty"
+    post_id = str(post.id)
+    for kind in _candidate_kinds(post.file_ext):
+        if await file_ids.get(post_id, kind):   # заодно поднимает file_id из БД в LRU
+            return "file_id"
+    # в Telegram поста ещё нет — скачиваем заранее, первая отправка сразу пойдёт в upload
+    prefetcher.schedule([post])
+    return "media"
+
+
+async def prewarm_broadcast(period: str = "week", fresh_for: float = 0.0):
+    """
+    Прогрев перед рассылкой: для каждого набора фильтров подписчиков заполняет буфер топа
+    (и пул с ранжированием за ним), поднимает file_id первого поста или скачивает его медиа.
+    fresh_for — сколько секунд до рассылки: буфер, который протухнет раньше, пополняется заново.
+    """
+    started = time.perf_counter()
+    groups: dict[str, list[str]] = {}
+    async for batch in iter_subscribers():
+        for _, filters in batch:
+            groups.setdefault(cache.filters_key(filters), filters)
+
+    sem = asyncio.Semaphore(PREWARM_CONCURRENCY)
+
+    async def warm_one(filters: list[str]) -> str:
+        async with sem:
+            try:
+                return await _prewarm_group(filters, period, fresh_for)
+            except Exception as e:
+                logging.warning("prewarm failed for filters %s: %s", filters, e)
+                return "error"
+
+    results = Counter(await asyncio.gather(*(warm_one(f) for f in groups.values())))
+    logging.info(
+        "Broadcast prewarm (%s): %d filter groups in %.1fs: %s",
+        period, len(groups), time.perf_counter() - started, dict(results)
+    )
+
+
+async def send_image_toeveryone(bot: Bot, period: str = "week", slot: datetime.datetime | None = None):
+    # slot — время слота планировщика: по нему id рассылки, так что перезапуск или
+    # догон того же слота продолжает её, а два слота в одну неделю — разные рассылки.
+    # Без slot (ручной запуск) — текущая минута
+    # план рассылки: один пост на каждый различный набор фильтров; пост получателя
+    # хранится, только пока его пачка в работе
+    group_posts: dict[str, Post | None] = {}
+    plan: dict[int, Post | None] = {}
+
+    async def load_batches(after_id: int) -> AsyncIterator[list[int]]:
+        async for batch in iter_subscribers(after_id):
+            for user_id, filters in batch:
+                key = cache.filters_key(filters)
+                if key not in group_posts:
+                    group_posts[key] = await _resolve_top_post(filters, period, lane=LANE_BROADCAST)
+                plan[user_id] = group_posts[key]
+            yield [user_id for user_id, _ in batch]
+        logging.info(f"Broadcast plan: {len(group_posts)} filter groups")
+
+    async def send_one(user_id: int):
+        await _send_post(bot, user_id, plan.get(user_id), caption=FURRY_TUESDAY_CAPTION)
+
+    slot = slot or datetime.datetime.now()
+    broadcast = Broadcast(
+        broadcast_id=f"{period}:{slot:%Y-%m-%dT%H:%M}", send_one=send_one, on_done=lambda user_id: plan.pop(user_id, None)
+    )
+    await broadcast.run(load_batches, count_subscribers)
@@ -0,0 +1,98 @@
+# services/media.py
+import os
+import tempfile
+import time
+
+from aiogram.types import BufferedInputFile, FSInputFile
+
+from config import MEDIA_MAX_MB, MEDIA_SPOOL_KB
+from services.http import http_clients
+from services.metrics import registry
+
+DOWNLOAD_CHUNK = 64 * 1024
+
+DOWNLOAD_SECONDS = registry.histogram("bot_media_download_seconds", "Скачивание медиа с CDN", ("result",))
+DOWNLOAD_BYTES = registry.counter("bot_media_download_bytes_total", "Скачано байт медиа с CDN")
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+class DownloadedMedia:
+    """Скачанный файл: маленький — в памяти, большой — во временном файле на диске."""
+
+    __slots__ = ("data", "path", "size", "ctype")
+
+    def __init__(self, data: bytes | None, path: str | None, size: int, ctype: str):
+        self.data = data
+        self.path = path
+        self.size = size
+        self.ctype = ctype
+
+    def input_file(self, filename: str):
+        if self.path is not None:
+            return FSInputFile(self.path, filename=filename)
+        return BufferedInputFile(self.data or b"", filename=filename)
+
+    def cleanup(self) -> None:
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self.data = None
+
+
+async def download(url: str) -> DownloadedMedia:
+    started = time.perf_counter()
+    result = "error"
+    try:
+        media = await _download_to_spool(url)
+        result = "ok"
+        return media
+    except MediaTooLarge:
+        result = "too_large"
+        raise
+    finally:
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result)
+
+
+async def _download_to_spool(url: str) -> DownloadedMedia:
+    max_bytes = MEDIA_MAX_MB * 1024 * 1024
+    spool_bytes = MEDIA_SPOOL_KB * 1024
+    async with http_clients.cdn().get(url) as r:
+        r.raise_for_status()
+        ctype = r.headers.get("Content-Type", "") or ""
+        decl = int(r.headers.get("Content-Length") or 0)
+        if decl > max_bytes:
+            raise MediaTooLarge(f"{decl} bytes declared, limit {max_bytes}")
+
+        buf = bytearray()
+        tmp = None
+        size = 0
+        try:
+            async for chunk in r.content.iter_chunked(DOWNLOAD_CHUNK):
+                size += len(chunk)
+                DOWNLOAD_BYTES.inc(amount=len(chunk))
+                if size > max_bytes:
+                    raise MediaTooLarge(f"more than {max_bytes} bytes received")
+                if tmp is None and size > spool_bytes:
+                    tmp = tempfile.NamedTemporaryFile(prefix="media_", delete=False)
+                    tmp.write(buf)
+                    buf = bytearray()
+                if tmp is not None:
+                    tmp.write(chunk)
+                else:
+                    buf.extend(chunk)
+        except BaseException:
+            if tmp is not None:
+                tmp.close()
+                os.unlink(tmp.name)
+            raise
+
+        if tmp is not None:
+            tmp.close()
+            return DownloadedMedia(None, tmp.name, size, ctype)
+        return DownloadedMedia(bytes(buf), None, size, ctype)
@@ -0,0 +1,206 @@
+# services/metrics.py
+import logging
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Sequence
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# секунды: от мгновенного ответа из буфера до долгого пополнения через несколько страниц
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: O(log buckets) на наблюдение, память не растёт."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-квантиль (inf, если за последней)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+# ---- Реестр метрик и эндпоинт в текстовом формате Prometheus ----
+#
+# Всё в одном event loop, поэтому без блокировок: счётчик — это инкремент в dict,
+# гистограмма — bisect по корзинам. Значения-«снимки» (размеры пулов, прогресс рассылки)
+# не обновляются на горячем пути, а считаются коллекторами только в момент опроса.
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: Any) -> None:
+        self.values[labels] = value
+
+
+class HistogramFamily:
+    """Гистограмма с метками: отдельный Histogram на каждое сочетание значений меток."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.children: Dict[tuple, Histogram] = {}
+
+    def child(self, *labels: Any) -> Histogram:
+        h = self.children.get(labels)
+        if h is None:
+            h = self.children[labels] = Histogram(self.buckets)
+        return h
+
+    def observe(self, value: float, *labels: Any) -> None:
+        self.child(*labels).observe(value)
+
+    def samples(self) -> List[str]:
+        out: List[str] = []
+        for key, h in self.children.items():
+            acc = 0
+            for bound, c in zip(h.buckets + (float("inf"),), h.counts):
+                acc += c
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(h.sum)}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {h.count}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Counter | HistogramFamily] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> HistogramFamily:
+        return self._register(HistogramFamily(name, help, labels, buckets))
+
+    def collector(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Функция, которая обновляет gauge-и перед каждым опросом (можно как декоратор)."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                logging.warning("metrics collector %s failed: %s", getattr(fn, "__name__", fn), e)
+        lines: List[str] = []
+        for m in self.metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт /metrics. Запускается и закрывается в bot.main()."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> None:
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info("Metrics endpoint: http://%s:%d/metrics", self.host, self.port)
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
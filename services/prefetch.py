@@ -0,0 +1,152 @@
+# services/prefetch.py
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from config import PREFETCH_DEPTH, PREFETCH_MEM_MB, PREFETCH_DISK_MB, PREFETCH_CONCURRENCY
+from parsers.models import Post
+from services.cache import Cache, cache
+from services.file_ids import file_ids
+from services.media import DownloadedMedia, download
+from services.metrics import registry
+
+# что бот отправляет загрузкой файла (остальное уходит ссылкой или документом)
+PREFETCH_EXTS = frozenset({"jpg", "jpeg", "png", "webp", "gif", "mp4"})
+
+PREFETCH_RESULTS = registry.counter(
+    "bot_prefetch_total", "Отправки по результату предзагрузки: hit, wait (ещё качалось), miss", ("result",)
+)
+PREFETCH_EVENTS = registry.counter(
+    "bot_prefetch_events_total", "Предзагрузки: started, known (file_id уже в БД), failed, evicted, dropped", ("event",)
+)
+PREFETCH_BYTES = registry.gauge("bot_prefetch_bytes", "Предзагруженные файлы", ("where",))
+
+
+class MediaPrefetcher:
+    """
+    Фоновая докачка медиа для следующих постов «горячих» буферов кэша, чтобы при клике
+    сразу шла загрузка в Telegram. Файлы лежат в памяти или (большие) на диске,
+    у каждого места свой бюджет байт; сверх него вытесняются самые старые.
+    Пост, выпавший из буфера, отменяет свою докачку и освобождает файл.
+    """
+
+    def __init__(self, mem_budget: int, disk_budget: int, concurrency: int):
+        self.mem_budget = mem_budget
+        self.disk_budget = disk_budget
+        self.mem_bytes = 0
+        self.disk_bytes = 0
+        self._ready: OrderedDict[str, DownloadedMedia] = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+
+    def attach(self, target: Cache) -> None:
+        target.on_hot = self.schedule
+        target.on_drop = self.discard
+
+    def _account(self, media: DownloadedMedia, sign: int) -> None:
+        if media.path is not None:
+            self.disk_bytes += sign * media.size
+        else:
+            self.mem_bytes += sign * media.size
+        PREFETCH_BYTES.set(self.mem_bytes, "memory")
+        PREFETCH_BYTES.set(self.disk_bytes, "disk")
+
+    def _remove(self, post_id: str) -> None:
+        media = self._ready.pop(post_id, None)
+        if media is not None:
+            self._account(media, -1)
+            media.cleanup()
+
+    def _shrink(self) -> None:
+        for post_id in list(self._ready):
+            if self.mem_bytes <= self.mem_budget and self.disk_bytes <= self.disk_budget:
+                return
+            on_disk = self._ready[post_id].path is not None
+            if (self.disk_bytes > self.disk_budget) if on_disk else (self.mem_bytes > self.mem_budget):
+                self._remove(post_id)
+                PREFETCH_EVENTS.inc("evicted")
+
+    def _store(self, post_id: str, media: DownloadedMedia) -> None:
+        budget = self.disk_budget if media.path is not None else self.mem_budget
+        if media.size > budget:
+            media.cleanup()
+            return
+        self._ready[post_id] = media
+        self._account(media, +1)
+        self._shrink()
+
+    async def _fetch(self, post_id: str, url: str) -> None:
+        try:
+            if await file_ids.known(post_id):
+                # в LRU не было, но file_id есть в БД (например, после перезапуска) — пост уйдёт без скачивания
+                PREFETCH_EVENTS.inc("known")
+                return
+            async with self._sem:
+                media = await download(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            PREFETCH_EVENTS.inc("failed")
+            logging.debug("prefetch failed for post %s: %s", post_id, e)
+            return
+        finally:
+            self._tasks.pop(post_id, None)
+        self._store(post_id, media)
+
+    def schedule(self, posts: Iterable[Post]) -> None:
+        for post in posts:
+            post_id = str(post.id)
+            if post_id in self._ready or post_id in self._tasks or post.file_ext not in PREFETCH_EXTS:
+                continue
+            if file_ids.peek(post_id):
+                continue    # уже загружен в Telegram — уйдёт по file_id без скачивания (БД проверит _fetch)
+            self._tasks[post_id] = asyncio.create_task(self._fetch(post_id, post.file_url))
+            PREFETCH_EVENTS.inc("started")
+
+    def forget(self, post_id: str) -> None:
+        """Отменяет докачку поста и освобождает уже скачанный файл."""
+        task = self._tasks.pop(post_id, None)
+        if task is not None:
+            task.cancel()
+            PREFETCH_EVENTS.inc("dropped")
+        if post_id in self._ready:
+            self._remove(post_id)
+            PREFETCH_EVENTS.inc("dropped")
+
+    def discard(self, posts: Iterable[Post]) -> None:
+        for post in posts:
+            self.forget(str(post.id))
+
+    async def take(self, post_id: str) -> DownloadedMedia | None:
+        """Забирает готовый файл (владение и cleanup() переходят к вызывающему)."""
+        result = "hit"
+        task = self._tasks.get(post_id)
+        if task is not None:
+            # докачка уже идёт — дождаться её дешевле, чем начинать заново
+            result = "wait"
+            await asyncio.wait({task})
+        media = self._ready.pop(post_id, None)
+        if media is None:
+            PREFETCH_RESULTS.inc("miss")
+            return None
+        self._account(media, -1)
+        PREFETCH_RESULTS.inc(result)
+        return media
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for post_id in list(self._ready):
+            self._remove(post_id)
+
+
+prefetcher = MediaPrefetcher(
+    mem_budget=PREFETCH_MEM_MB * 1024 * 1024,
+    disk_budget=PREFETCH_DISK_MB * 1024 * 1024,
+    concurrency=PREFETCH_CONCURRENCY,
+)
+if PREFETCH_DEPTH > 0:
+    prefetcher.attach(cache)
@@ -0,0 +1,203 @@
+# services/prepare.py
+import asyncio
+import io
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+from config import PHOTO_MAX_SIDE, PHOTO_QUALITY, PREPARE_WORKERS, PREPARE_CACHE_MB
+from parsers.models import Post
+from services.media import DownloadedMedia, download
+from services.metrics import registry
+
+try:  # пережатие картинок, если установлен Pillow
+    import PIL  # noqa: F401
+
+    RESIZE_BACKEND = "pillow"
+except ImportError:  # pragma: no cover - зависит от окружения
+    RESIZE_BACKEND = None
+
+MAX_PHOTO_MB = 10
+PHOTO_EXTS = {"jpg", "jpeg", "png", "webp"}
+CONVERT_EXTS = {"bmp", "tif", "tiff", "jfif"}   # send_photo их не примет, но в JPEG пережать можно
+PHOTO_MAX_SIDES_SUM = 10000                     # ограничения send_photo на размеры
+PHOTO_MAX_RATIO = 20
+
+PREPARE_RESULTS = registry.counter(
+    "bot_photo_prepare_total", "Источник фото для отправки: file, resized, sample, preview, cached или none", ("source",)
+)
+RESIZE_SECONDS = registry.histogram("bot_photo_resize_seconds", "Пережатие картинки в пуле процессов", ("result",))
+
+
+def _resize_image(src: bytes | str, max_side: int, quality: int) -> bytes:
+    """Выполняется в дочернем процессе: уменьшает картинку до max_side и кодирует в JPEG."""
+    from PIL import Image, ImageOps
+
+    with Image.open(src if isinstance(src, str) else io.BytesIO(src)) as img:
+        img.draft("RGB", (max_side, max_side))    # JPEG декодируется сразу в уменьшенном виде
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def wants_photo(post: Post) -> bool:
+    """Можно ли отправить пост через send_photo (возможно, после пережатия)."""
+    ext = post.file_ext
+    if ext not in PHOTO_EXTS and not (ext in CONVERT_EXTS and RESIZE_BACKEND):
+        return False
+    if post.width and post.height:
+        # пропорции пережатие не исправит — такие посты уходят документом
+        return max(post.width, post.height) <= PHOTO_MAX_RATIO * min(post.width, post.height)
+    return True
+
+
+class PhotoPreparer:
+    """
+    Подготовка поста к send_photo. Источник выбирается по заявленным размерам:
+    оригинал, если он влезает в PHOTO_MAX_SIDE и лимит фото; иначе он уменьшается
+    в пуле процессов (не блокируя event loop); без Pillow или при неудаче — sample_url,
+    затем preview_url. Пережатые и уменьшенные копии кэшируются по id поста.
+    """
+
+    def __init__(self, workers: int, cache_bytes: int, max_side: int, quality: int):
+        self.workers = max(1, workers)
+        self.cache_bytes = cache_bytes
+        self.max_side = max_side
+        self.quality = quality
+        self._executor: ProcessPoolExecutor | None = None
+        self._cache: OrderedDict[int, Tuple[bytes, str]] = OrderedDict()
+        self._cached_bytes = 0
+
+    def _fits(self, post: Post) -> bool | None:
+        if not post.width or not post.height:
+            return None
+        return max(post.width, post.height) <= self.max_side
+
+    def _remember(self, post_id: int, data: bytes, ext: str) -> None:
+        if len(data) > self.cache_bytes:
+            return
+        old = self._cache.pop(post_id, None)
+        if old is not None:
+            self._cached_bytes -= len(old[0])
+        self._cache[post_id] = (data, ext)
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.cache_bytes:
+            _, (evicted, _) = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+
+    async def _download(self, url: str) -> DownloadedMedia | None:
+        try:
+            return await download(url)
+        except Exception as e:
+            logging.info("photo source %s unavailable: %s", url, e)
+            return None
+
+    async def _resize(self, media: DownloadedMedia) -> bytes | None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        src = media.path if media.path is not None else media.data
+        started = time.perf_counter()
+        result = "error"
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _resize_image, src, self.max_side, self.quality
+            )
+            result = "ok"
+            return data
+        except Exception as e:
+            logging.warning("photo resize failed: %s", e)
+            return None
+        finally:
+            RESIZE_SECONDS.observe(time.perf_counter() - started, result)
+
+    async def _prepare(
+        self, post: Post, original: DownloadedMedia | None
+    ) -> Tuple[Tuple[DownloadedMedia, str, str] | None, DownloadedMedia | None]:
+        limit = MAX_PHOTO_MB * 1024 * 1024
+        ext = post.file_ext
+        small = self._fits(post)
+        accepted = not post.width or post.width + post.height <= PHOTO_MAX_SIDES_SUM
+        if ext in PHOTO_EXTS and accepted and (small is not False or not RESIZE_BACKEND):
+            original = original or await self._download(post.file_url)
+            if original is not None and original.size <= limit:
+                return (original, ext, "file"), None
+
+        if RESIZE_BACKEND:
+            # оригинал больше, чем Telegram всё равно покажет: уменьшаем сами и шлём маленький JPEG
+            original = original or await self._download(post.file_url)
+            if original is not None:
+                try:
+                    data = await self._resize(original)
+                except BaseException:
+                    original.cleanup()
+                    raise
+                if data is not None:
+                    original.cleanup()
+                    self._remember(post.id, data, "jpg")
+                    return (DownloadedMedia(data, None, len(data), "image/jpeg"), "jpg", "resized"), None
+
+        for source, url in (("sample", post.sample_url), ("preview", post.preview_url)):
+            if not url:
+                continue
+            media = await self._download(url)
+            if media is None:
+                continue
+            if media.size > limit:
+                media.cleanup()
+                continue
+            src_ext = url.rsplit(".", 1)[-1].lower()
+            src_ext = src_ext if src_ext in PHOTO_EXTS else "jpg"
+            if media.path is None and media.data is not None:
+                self._remember(post.id, media.data, src_ext)
+            if original is not None:
+                original.cleanup()
+            return (media, src_ext, source), None
+        # фото не получилось, но скачанный оригинал ещё пригодится — документом
+        return None, original
+
+    async def prepare(
+        self, post: Post, original: DownloadedMedia | None = None
+    ) -> Tuple[Tuple[DownloadedMedia, str] | None, DownloadedMedia | None]:
+        """
+        (файл для send_photo и его расширение, None) или, если фото не получилось, (None, оригинал).
+        original (уже скачанный оригинал) переходит во владение: он уходит в фото, освобождается
+        или возвращается вторым элементом, чтобы вызывающий не качал его заново (None — не скачан).
+        """
+        cached = self._cache.get(post.id)
+        if cached is not None:
+            self._cache.move_to_end(post.id)
+            if original is not None:
+                original.cleanup()
+            PREPARE_RESULTS.inc("cached")
+            data, ext = cached
+            return (DownloadedMedia(data, None, len(data), "image/jpeg"), ext), None
+        prepared, original = await self._prepare(post, original)
+        if prepared is None:
+            PREPARE_RESULTS.inc("none")
+            return None, original
+        media, ext, source = prepared
+        PREPARE_RESULTS.inc(source)
+        return (media, ext), None
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+photos = PhotoPreparer(
+    workers=PREPARE_WORKERS,
+    cache_bytes=PREPARE_CACHE_MB * 1024 * 1024,
+    max_side=PHOTO_MAX_SIDE,
+    quality=PHOTO_QUALITY,
+)
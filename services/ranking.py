@@ -0,0 +1,97 @@
+# services/ranking.py
+import heapq
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from config import RANKING_SCORER, RANKING_GRAVITY, RANKING_PENALTY_TAGS, RANKING_PENALTY
+from parsers.models import Post
+
+# Оценка поста: (пост, возраст в часах на момент загрузки) -> число, больше — лучше.
+# Оценка считается, когда пост попал в индекс, и пересчитывается при периодическом обновлении
+# score постов окна (PeriodIngester): score — из последнего ответа API, возраст — на момент пересчёта.
+Scorer = Callable[[Post, float], float]
+
+
+def score_raw(post: Post, age_hours: float) -> float:
+    """Голый score Gelbooru — как sort:score на сайте."""
+    return float(post.score)
+
+
+def score_velocity(post: Post, age_hours: float) -> float:
+    """Скорость набора score: свежий пост с тем же score выше старого (как «hot» на форумах)."""
+    return post.score / (age_hours + 2.0) ** RANKING_GRAVITY
+
+
+def score_penalized(post: Post, age_hours: float) -> float:
+    """Скорость набора score со штрафом за теги, которыми обычно накручивают топ."""
+    rank = score_velocity(post, age_hours)
+    hits = len(RANKING_PENALTY_TAGS & post.tags)
+    return rank * (RANKING_PENALTY ** hits) if rank > 0 else rank
+
+
+SCORERS: Dict[str, Scorer] = {
+    "raw": score_raw,
+    "velocity": score_velocity,
+    "penalized": score_penalized,
+}
+
+
+def get_scorer(name: str = RANKING_SCORER) -> Scorer:
+    try:
+        return SCORERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown ranking scorer: {name!r} (known: {', '.join(SCORERS)})")
+
+
+def rank_post(post: Post, created_at: datetime | None, scorer: Scorer, now: datetime | None = None) -> float:
+    now = now or datetime.now()
+    age_hours = max(0.0, (now - created_at).total_seconds() / 3600) if created_at else 0.0
+    post.rank = scorer(post, age_hours)
+    return post.rank
+
+
+class TopK:
+    """
+    Ограниченный топ: min-куча по оценке, при переполнении вытесняется худший пост.
+    Удаление (старение из окна) — ленивое: запись помечается и выбрасывается, когда доходит до вершины.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._heap: List[Tuple[float, int]] = []   # (rank, post_id)
+        self._alive: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._alive)
+
+    def _drop_dead(self) -> None:
+        while self._heap and self._alive.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def add(self, post_id: int, rank: float) -> int | None:
+        """Добавляет пост; возвращает id вытесненного поста (или его самого, если он хуже всех)."""
+        self._alive[post_id] = rank
+        heapq.heappush(self._heap, (rank, post_id))
+        if len(self._alive) <= self.capacity:
+            return None
+        self._drop_dead()
+        _, worst = heapq.heappop(self._heap)
+        del self._alive[worst]
+        return worst
+
+    def update(self, post_id: int, rank: float) -> None:
+        """Новая оценка поста, который уже в топе; старая запись становится мёртвой."""
+        if post_id not in self._alive:
+            return
+        self._alive[post_id] = rank
+        heapq.heappush(self._heap, (rank, post_id))
+        self._compact()
+
+    def discard(self, post_id: int) -> None:
+        self._alive.pop(post_id, None)
+        self._compact()
+
+    def _compact(self) -> None:
+        if len(self._heap) > 2 * len(self._alive) + 64:
+            self._heap = [(r, i) for i, r in self._alive.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,157 @@
+# services/ratelimit.py
+import asyncio
+import heapq
+import time
+import logging
+from typing import Any, Dict, List, Tuple
+
+from config import GELBOORU_RATE, GELBOORU_BURST, GELBOORU_MIN_RATE
+from services.coord import PostgresCoordinator, coord
+from services.metrics import registry
+
+# Полосы приоритета: меньше — важнее
+LANE_INTERACTIVE = 0   # пользователь ждёт ответа прямо сейчас
+LANE_REFILL      = 1   # фоновые/упреждающие пополнения кэша
+LANE_BROADCAST   = 2   # подготовка рассылки
+LANE_NAMES = {LANE_INTERACTIVE: "interactive", LANE_REFILL: "refill", LANE_BROADCAST: "broadcast"}
+
+LIMITER_WAIT = registry.histogram("bot_ratelimit_wait_seconds", "Ожидание токена Gelbooru по полосе", ("lane",))
+LIMITER_QUEUED = registry.gauge("bot_ratelimit_queued", "Ожидающие токена по полосе", ("lane",))
+LIMITER_RATE = registry.gauge("bot_ratelimit_rate", "Текущая адаптивная скорость, запросов/сек")
+
+
+class _LaneStats:
+    __slots__ = ("acquired", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class PriorityRateLimiter:
+    """
+    Token bucket с очередями по приоритету. Токены раздаются сначала интерактивной полосе,
+    затем пополнениям и рассылке. Скорость адаптивная: 429/503 режут её вдвое
+    (и Retry-After ставит паузу), успешные ответы плавно возвращают к базовой.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, min_rate: float):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._seq = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._dispatcher: asyncio.Task | None = None
+        self._stats: Dict[int, _LaneStats] = {lane: _LaneStats() for lane in LANE_NAMES}
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _record(self, lane: int, waited: float) -> None:
+        st = self._stats.setdefault(lane, _LaneStats())
+        st.acquired += 1
+        st.wait_total += waited
+        st.wait_max = max(st.wait_max, waited)
+        LIMITER_WAIT.observe(waited, LANE_NAMES.get(lane, str(lane)))
+
+    async def _take(self, now: float) -> float:
+        """Один токен: 0 — выдан, иначе через сколько секунд пробовать снова."""
+        if isinstance(coord, PostgresCoordinator):
+            # несколько экземпляров делят одно ведро в БД; локальная скорость задаёт темп пополнения
+            try:
+                return await coord.take_token(self.name, self.rate, self.burst)
+            except Exception as e:
+                logging.warning("rate limiter: shared bucket unavailable, using local: %s", e)
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    async def acquire(self, lane: int = LANE_INTERACTIVE) -> None:
+        now = time.monotonic()
+        if not self._waiters and now >= self.paused_until:
+            if await self._take(now) <= 0.0:
+                self._record(lane, time.monotonic() - now)
+                return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (lane, self._seq, fut))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await fut
+        self._record(lane, time.monotonic() - now)
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            # отменённые ожидающие не должны съедать токены
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            wait = await self._take(now)
+            if wait <= 0.0:
+                # пока ждали ведро, голова очереди могла смениться или отмениться
+                while self._waiters:
+                    _, _, fut = heapq.heappop(self._waiters)
+                    if not fut.done():
+                        fut.set_result(None)
+                        break
+                continue
+            await asyncio.sleep(wait)
+
+    def feedback(self, status: int, retry_after: float | None = None) -> None:
+        if status in (429, 503):
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            coord.pause(self.name, pause)
+            logging.warning("rate limiter: upstream %s, rate -> %.2f req/s, pause %.1fs", status, self.rate, pause)
+        elif 200 <= status < 300 and self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+    def stats(self) -> Dict[str, Any]:
+        depth = {name: 0 for name in LANE_NAMES.values()}
+        for lane, _, fut in self._waiters:
+            if not fut.done():
+                depth[LANE_NAMES.get(lane, str(lane))] += 1
+        lanes = {}
+        for lane, st in self._stats.items():
+            lanes[LANE_NAMES.get(lane, str(lane))] = {
+                "queued": depth.get(LANE_NAMES.get(lane, str(lane)), 0),
+                "acquired": st.acquired,
+                "wait_avg": st.wait_total / st.acquired if st.acquired else 0.0,
+                "wait_max": st.wait_max,
+            }
+        return {"rate": self.rate, "base_rate": self.base_rate, "tokens": self.tokens, "lanes": lanes}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+gelbooru_limiter = PriorityRateLimiter(name="gelbooru", rate=GELBOORU_RATE, burst=GELBOORU_BURST, min_rate=GELBOORU_MIN_RATE)
+
+
+@registry.collector
+def _collect_limiter() -> None:
+    LIMITER_RATE.set(gelbooru_limiter.rate)
+    for name, st in gelbooru_limiter.stats()["lanes"].items():
+        LIMITER_QUEUED.set(st["queued"], name)
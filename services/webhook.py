@@ -0,0 +1,127 @@
+# services/webhook.py
+import asyncio
+import logging
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_DRAIN_SEC,
+)
+from services.metrics import registry
+
+WEBHOOK_INFLIGHT = registry.gauge("bot_webhook_inflight", "Апдейты, которые сейчас обрабатываются")
+WEBHOOK_UPDATES = registry.counter("bot_webhook_updates_total", "Обработанные апдейты по результату", ("result",))
+
+
+class WebhookServer:
+    """
+    Приём апдейтов через webhook: aiohttp-сервер с проверкой X-Telegram-Bot-Api-Secret-Token
+    и /healthz для балансировщика. Апдейт обрабатывается в фоне (Telegram сразу получает 200),
+    поэтому незавершённые обработчики считаются отдельно и дожидаются при остановке.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.dp = dp
+        self.draining = False
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stop = asyncio.Event()
+        self._runner: web.AppRunner | None = None
+        self._site: web.TCPSite | None = None
+        self._started_at = time.time()
+        dp.update.outer_middleware(self._track)
+
+    async def _track(
+        self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        self._inflight += 1
+        self._idle.clear()
+        WEBHOOK_INFLIGHT.set(self._inflight)
+        try:
+            result = await handler(event, data)
+            WEBHOOK_UPDATES.inc("ok")
+            return result
+        except Exception:
+            WEBHOOK_UPDATES.inc("error")
+            raise
+        finally:
+            self._inflight -= 1
+            WEBHOOK_INFLIGHT.set(self._inflight)
+            if self._inflight == 0:
+                self._idle.set()
+
+    async def _health(self, request: web.Request) -> web.Response:
+        # во время остановки отвечаем 503, чтобы балансировщик перестал слать сюда трафик
+        body = {
+            "status": "draining" if self.draining else "ok",
+            "inflight": self._inflight,
+            "uptime": int(time.time() - self._started_at),
+        }
+        return web.json_response(body, status=503 if self.draining else 200)
+
+    async def start(self) -> None:
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL and WEBHOOK_SECRET (set in .env)")
+        app = web.Application()
+        SimpleRequestHandler(dispatcher=self.dp, bot=self.bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        app.router.add_get("/healthz", self._health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await self._site.start()
+
+        await self.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+        logging.info("Webhook server listening on %s:%d%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    async def shutdown(self) -> None:
+        """Перестаёт принимать апдейты, дожидается начатых (не дольше WEBHOOK_DRAIN_SEC) и гасит сервер."""
+        self.draining = True
+        if self._site is not None:
+            await self._site.stop()
+        await asyncio.sleep(0)  # апдейты, принятые последними, успевают дойти до _track
+        if self._inflight:
+            logging.info("Webhook: waiting for %d in-flight updates", self._inflight)
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=WEBHOOK_DRAIN_SEC)
+            except asyncio.TimeoutError:
+                logging.warning("Webhook: %d updates still running after %ss, shutting down anyway",
+                                self._inflight, WEBHOOK_DRAIN_SEC)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        # webhook в Telegram не снимаем: за балансировщиком его обслуживают другие экземпляры
+        await self.bot.session.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def serve(self) -> None:
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:  # pragma: no cover - Windows
+                pass
+        try:
+            await self._stop.wait()
+        finally:
+            logging.info("Webhook: shutting down")
+            await self.shutdown()